@@ -0,0 +1,197 @@
+from __future__ import annotations
+from typing import Dict, Tuple
+import numpy as np
+from sparse_probability import DestinationCSR
+
+"""
+Lockstep engine: simulates many replications of a day at once by carrying a replication
+axis through the state. Bike stock is a (reps, hubs) array and in-transit bikes are
+counts per (arrival hour, rep, destination), so each hour is a fixed set of array
+operations whatever the number of replications.
+
+The rules are those of simulation_code.simulation:
+    - each hour, bikes due this hour dock first, then rentals happen
+    - a rental succeeds while the hub has bikes; the rest are no-bike events
+    - a trip of t minutes docks ceil(t / 60) hours later; trips still out at midnight are dropped
+    - a trip drawn back to its own hub (only possible for an all-zero probability row,
+      which falls back to uniform) leaves the system
+    - arrivals beyond a hub's free docks are no-parking events and ride on to the nearest
+      hub with a free dock, or wait an hour at the full hub if every hub is full
+Overflow riders all look for a free dock after the hour's docking has happened, where
+simulation() lets each rider see the docks as they were when it arrived; the event counts
+at the full hub are the same, only which hub a redirected bike ends up at can differ.
+"""
+
+# destinations held across every cached row of a DestinationTable
+_CACHE_ENTRIES = 1 << 22
+
+
+class DestinationTable:
+    """ Per-(hour, origin) destination distributions for batched multinomial draws
+
+    Wraps a build_probabilities result, a (hubs, 24, hubs) array or a DestinationCSR and
+    hands out (destinations, probabilities) pairs, normalized once and cached, with the
+    uniform fallback simulation() uses for all-zero rows. Hours that read the same row (the
+    same CSR row, or the same dense array memory, as every hour of a block does) share one
+    cache entry (each entry keeps a reference to the row it was built from, so the memory
+    its key names cannot be freed and reused by another row), destinations are int32, and a dense row with no zero entry shares a single
+    arange instead of its own index array. The cache holds at most _CACHE_ENTRIES
+    destinations, evicting the oldest rows first, so huge dense networks recompute rows
+    instead of holding a copy of every block.
+    """
+    def __init__(self, possibilities, num_hubs: int) -> None:
+        self._possibilities = possibilities
+        self._num_hubs = num_hubs
+        self._sparse = isinstance(possibilities, DestinationCSR)
+        self._all = np.arange(num_hubs, dtype=np.int32)
+        self._max_rows = max(1, _CACHE_ENTRIES // max(num_hubs, 1))
+        self._cache: Dict[Tuple, Tuple[np.ndarray, np.ndarray, np.ndarray, object]] = {}
+
+    def row(self, hub: int, hour: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        returns:
+            dests: hub indices with non-zero probability
+            probs: their probabilities, summing to 1
+        """
+        return self._entry(hub, hour)[:2]
+
+    def sample(self, hub: int, hour: int, size: int, rng: np.random.Generator) -> np.ndarray:
+        """
+        size destinations for rentals at hub during hour. Uses the same cdf and uniforms as
+        rng.choice(dests, size, p=probs), so results match it draw for draw.
+        """
+        dests, _, cdf = self._entry(hub, hour)[:3]
+        return dests[cdf.searchsorted(rng.random(size), side="right")]
+
+    def _entry(self, hub: int, hour: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, object]:
+        if self._sparse:
+            csr = self._possibilities
+            key = ("csr", int(csr.hour_table[hour]), hub)
+            p = row = None
+        else:
+            p = row = self._possibilities[hub][hour]
+            if isinstance(p, np.ndarray):
+                # the row's memory: rows of one block share it, and the entry holds row, so
+                # no other row can be allocated at this address while the entry lives
+                key = ("memory", p.__array_interface__["data"][0], p.shape, p.strides, p.dtype.str)
+            else:
+                key = ("hour", hub, hour)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        if self._sparse:
+            start, stop = csr._span(hub, hour)
+            dests = csr.indices[start:stop]
+            probs = np.diff(csr.cdf[start:stop], prepend=0.0)
+        else:
+            p = np.asarray(p, dtype=float)
+            nonzero = p > 0
+            if nonzero.all():
+                dests, probs = self._all, p
+            else:
+                dests = np.flatnonzero(nonzero).astype(np.int32)
+                probs = p[dests]
+        total = probs.sum()
+        if total > 0:
+            probs = probs / total
+        else:
+            dests = self._all
+            probs = np.full(self._num_hubs, 1 / self._num_hubs)
+        cdf = probs.cumsum()
+        cdf /= cdf[-1]
+        if len(self._cache) >= self._max_rows:
+            del self._cache[next(iter(self._cache))]
+        self._cache[key] = (dests, probs, cdf, row)
+        return self._cache[key]
+
+
+def arrival_steps(travel: np.ndarray) -> np.ndarray:
+    """
+    Hours until a trip docks, ceil(minutes / 60) and at least 1, for every (origin, dest).
+    """
+    return np.maximum(np.ceil(np.asarray(travel) / 60.0), 1).astype(int)
+
+
+def simulate_batch(
+        travel: np.ndarray,
+        demand: np.ndarray,
+        possibilities,
+        *,
+        max_bikes_per_hub: int = 10,
+        initial_bikes_per_hub: int = 5,
+        rng: np.random.Generator | None = None,
+        destinations: DestinationTable | None = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Parameters:
+    travel - (hubs, hubs) travel time in minutes
+    demand - (reps, hubs, 24) rental requests per replication, hub and hour
+    possibilities - destination probabilities in the build_probabilities layout, a
+        (hubs, 24, hubs) array or a DestinationCSR
+    keyword args - must be passed with name
+        max_bikes_per_hub, initial_bikes_per_hub - as in simulation()
+        rng - NumPy generator for destination draws
+        destinations - a DestinationTable to reuse across calls, built from possibilities when None
+
+    Returns:
+    no_bike_events - (reps, 24) no-bike events per replication and hour
+    no_parking_events - (reps, 24) no-parking events per replication and hour
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    demand = np.asarray(demand)
+    reps, num_hubs, hours = demand.shape
+    travel = np.asarray(travel)
+    if destinations is None:
+        destinations = DestinationTable(possibilities, num_hubs)
+    steps = arrival_steps(travel)
+    horizon = int(steps.max()) + 1
+    nearest = [order[order != hub] for hub, order in enumerate(np.argsort(travel, axis=1, kind="stable"))]
+
+    bike_stock = np.full((reps, num_hubs), initial_bikes_per_hub, dtype=np.int64)
+    # bikes due to dock, ring buffer indexed by hour % horizon
+    pending = np.zeros((horizon, reps, num_hubs), dtype=np.int64)
+    no_bike_events = np.zeros((reps, hours), dtype=np.int64)
+    no_parking_events = np.zeros((reps, hours), dtype=np.int64)
+    rep_index = np.arange(reps)
+
+    for hour in range(hours):
+        slot = hour % horizon
+        arrivals = pending[slot].copy()
+        pending[slot] = 0
+
+        # dock up to the free space, the rest overflow
+        docked = np.minimum(arrivals, np.maximum(max_bikes_per_hub - bike_stock, 0))
+        overflow = arrivals - docked
+        bike_stock += docked
+        no_parking_events[:, hour] = overflow.sum(axis=1)
+
+        # overflow rides on to the nearest hub with a free dock, or waits an hour
+        has_space = bike_stock < max_bikes_per_hub
+        for dest in np.flatnonzero(overflow.any(axis=0)):
+            riders = overflow[:, dest]
+            open_hubs = has_space[:, nearest[dest]]
+            found = open_hubs.any(axis=1)
+            target = nearest[dest][open_hubs.argmax(axis=1)]
+            target = np.where(found, target, dest)
+            wait = np.where(found, steps[dest, target], 1)
+            np.add.at(pending, ((hour + wait) % horizon, rep_index, target), riders)
+
+        # rentals: sequential checkouts at a hub succeed while bikes last
+        requests = demand[:, :, hour]
+        rented = np.minimum(requests, bike_stock)
+        no_bike_events[:, hour] = (requests - rented).sum(axis=1)
+        bike_stock -= rented
+
+        for hub in np.flatnonzero(rented.any(axis=0)):
+            dests, probs = destinations.row(hub, hour)
+            counts = rng.multinomial(rented[:, hub], probs)
+            keep = dests != hub
+            dests, counts = dests[keep], counts[:, keep]
+            due = (hour + steps[hub, dests]) % horizon
+            for step_slot in np.unique(due):
+                cols = due == step_slot
+                pending[step_slot][:, dests[cols]] += counts[:, cols]
+
+    return no_bike_events, no_parking_events
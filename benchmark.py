@@ -0,0 +1,137 @@
+from __future__ import annotations
+import argparse
+import json
+import platform
+import sys
+import time
+from typing import Callable, Dict, List
+import numpy as np
+import non_homogenous_poisson as nhp
+import simulation_main as sim
+import simulation_code as code
+from network_generator import Network, generate_network, middlebury_network
+
+"""
+Offline benchmark harness for the simulation pipeline. Times each stage
+(nhp, bin_events_by_hour, the counts-only build_distributions that replaces
+both, build_probabilities, build_complete_digraph, simulation) and the whole run_simulation over a grid of demand multipliers
+and hub counts, and reports the timings as JSON so runs can be diffed for
+regressions.
+
+    python benchmark.py --output bench.json
+"""
+
+DEMAND_MULTIPLIERS = (1, 10, 100)
+HUB_COUNTS = (10, 50, 200)
+
+
+def best_time(func: Callable[[], object], repeat: int) -> float:
+    """
+    Run func repeat times and return the fastest wall-clock time in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_network(num_hubs: int, multiplier: int, seed: int = 0) -> Network:
+    """
+    The real Middlebury network for 10 hubs, a generate_network layout otherwise, with
+    every lambda multiplied by multiplier.
+    """
+    net = middlebury_network() if num_hubs == 10 else generate_network(num_hubs, seed=seed)
+    net.lambda_array = net.lambda_array * multiplier
+    return net
+
+
+def benchmark_case(
+    num_hubs: int,
+    multiplier: int,
+    *,
+    day: str = "W",
+    repeat: int = 3,
+    replications: int = 5,
+    ) -> Dict[str, object]:
+    """
+    Time every pipeline stage, and the whole run_simulation, for one grid point.
+    returns:
+        dictionary with the grid point, total demand and per-stage seconds
+    """
+    net = benchmark_network(num_hubs, multiplier)
+    lambdas, travel = net.lambdas, net.travel_time
+    probs = net.probabilities()
+    timestamps = {hub: nhp.nhp(lambdas[hub][day]) for hub in range(num_hubs)}
+    poisson = {hub: nhp.bin_events_by_hour(timestamps[hub], 24) for hub in range(num_hubs)}
+
+    stages: Dict[str, float] = {}
+    stages["nhp"] = best_time(
+        lambda: [nhp.nhp(lambdas[hub][day]) for hub in range(num_hubs)], repeat)
+    stages["bin_events_by_hour"] = best_time(
+        lambda: [nhp.bin_events_by_hour(timestamps[hub], 24) for hub in range(num_hubs)], repeat)
+    stages["build_distributions_counts_only"] = best_time(
+        lambda: sim.build_distributions(net.lambda_array, 24, day, num_hubs, counts_only=True), repeat)
+    stages["build_probabilities"] = best_time(lambda: sim.build_probabilities(num_hubs, net.blocks), repeat)
+    stages["build_complete_digraph"] = best_time(
+        lambda: code.build_complete_digraph(travel), repeat)
+    stages["simulation"] = best_time(
+        lambda: code.simulation(travel, poisson, probs, keep_log=False), repeat)
+    stages["run_simulation"] = best_time(
+        lambda: sim.run_simulation(10, 5, hourly_lambdas=lambdas, day=day, travel=travel,
+                                   probabilities=probs, replications=replications), 1)
+
+    return {
+        "hubs": num_hubs,
+        "multiplier": multiplier,
+        "rentals_per_day": int(sum(p.sum() for p in poisson.values())),
+        "replications": replications,
+        "seconds": stages,
+    }
+
+
+def run_benchmarks(
+    hub_counts: List[int],
+    multipliers: List[int],
+    *,
+    repeat: int = 3,
+    replications: int = 5,
+    ) -> Dict[str, object]:
+    """
+    Benchmark every (hub count, multiplier) pair.
+    returns:
+        JSON-ready report with environment metadata and one entry per grid point
+    """
+    results = []
+    for num_hubs in hub_counts:
+        for multiplier in multipliers:
+            results.append(benchmark_case(num_hubs, multiplier, repeat=repeat, replications=replications))
+    return {
+        "meta": {
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the middbike simulation pipeline.")
+    parser.add_argument("--hubs", type=int, nargs="+", default=list(HUB_COUNTS))
+    parser.add_argument("--multipliers", type=int, nargs="+", default=list(DEMAND_MULTIPLIERS))
+    parser.add_argument("--repeat", type=int, default=3, help="best-of repeats per stage")
+    parser.add_argument("--replications", type=int, default=5, help="days per run_simulation call")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.hubs, args.multipliers, repeat=args.repeat, replications=args.replications)
+    text = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
@@ -0,0 +1,119 @@
+from __future__ import annotations
+from typing import Tuple
+import numpy as np
+from fluid_model import as_destination_tensor, expected_inflow
+
+"""
+Stockout and full-dock probabilities without sampling. Each hub on its own is a birth-death
+chain on its stock 0..capacity: during hour h bikes are rented at rate lambda[hub, h] (while
+stock > 0) and returned at the hub's expected inflow rate (while stock < capacity). The
+stock distribution is carried from hour to hour exactly by uniformization: with
+Lambda = rental rate + return rate and the jump matrix P = I + Q / Lambda,
+
+    pi(t) = sum_k Poisson(k; Lambda t) * pi(0) P^k
+
+and the hour-average of pi(t), which gives the expected share of the hour a hub spends
+empty or full, is the same sum weighted by P(Poisson(Lambda) > k) / Lambda. P is
+tridiagonal, so each term is a few array operations for every hub and configuration at
+once. Hubs are coupled only through the expected inflow, which assumes every requested
+rental happens; the answer is exact for that chain, with no Monte Carlo noise.
+
+    rentals, returns = hub_rates(travel_time, lambda_matrix(lambdas, "W", 10), build_probabilities(10))
+    p_empty, p_full, no_bike, no_parking = stock_probabilities(rentals, returns, [5, 10], [10, 20])
+"""
+
+# Poisson tail mass left out of the uniformization sum
+_TOLERANCE = 1e-12
+
+
+def hub_rates(travel: np.ndarray, lambdas: np.ndarray, possibilities) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    params:
+        possibilities: destination probabilities in any form fluid_model.as_destination_tensor
+            accepts, like fluid_simulation and flow_report.expected_flows
+    returns:
+        rentals: (hubs, 24) rental request rate per hub and hour (lambdas)
+        returns: (hubs, 24) expected return rate, fluid_model.expected_inflow
+    """
+    lambdas = np.asarray(lambdas, dtype=float)
+    tensor = as_destination_tensor(possibilities, lambdas.shape[0])
+    return lambdas, expected_inflow(travel, lambdas, tensor)
+
+
+def _terms(rate: np.ndarray) -> int:
+    # uniformization terms needed for the largest rate in the batch
+    peak = float(rate.max(initial=0.0))
+    return int(peak + 10 * np.sqrt(peak) + 20)
+
+
+def stock_probabilities(
+    rentals: np.ndarray,
+    returns: np.ndarray,
+    initial_bikes_per_hub,
+    max_bikes_per_hub,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Parameters:
+    rentals, returns - (hubs, 24) rates per hour, e.g. from hub_rates
+    initial_bikes_per_hub, max_bikes_per_hub - scalars, (configs,) or (configs, hubs)
+
+    Returns:
+    p_empty - (configs, hubs, 24) share of each hour the hub spends with no bike
+    p_full - (configs, hubs, 24) share of each hour the hub spends with every dock taken
+    no_bike - (configs, hubs, 24) expected no-bike events, rentals * p_empty
+    no_parking - (configs, hubs, 24) expected no-parking events, returns * p_full
+    """
+    rentals = np.asarray(rentals, dtype=float)
+    returns = np.asarray(returns, dtype=float)
+    num_hubs, hours = rentals.shape
+    initial = np.asarray(initial_bikes_per_hub, dtype=np.intp)
+    capacity = np.asarray(max_bikes_per_hub, dtype=np.intp)
+    initial = initial.reshape(-1, 1) if initial.ndim < 2 else initial
+    capacity = capacity.reshape(-1, 1) if capacity.ndim < 2 else capacity
+    initial, capacity = np.broadcast_arrays(initial, capacity)
+    initial = np.broadcast_to(np.minimum(initial, capacity), (initial.shape[0], num_hubs))
+    capacity = np.broadcast_to(capacity, initial.shape)
+    configs = initial.shape[0]
+
+    # states 0..max capacity; states above a chain's own capacity are never reached
+    states = np.arange(int(capacity.max()) + 1)
+    below_cap = states[None, None, :] < capacity[:, :, None]
+    above_zero = states > 0
+    at_cap = states[None, None, :] == capacity[:, :, None]
+
+    dist = (states[None, None, :] == initial[:, :, None]).astype(float)
+    p_empty = np.zeros((configs, num_hubs, hours))
+    p_full = np.zeros((configs, num_hubs, hours))
+
+    for hour in range(hours):
+        up = np.where(below_cap, returns[None, :, hour, None], 0.0)
+        down = np.where(above_zero, rentals[None, :, hour, None], 0.0)
+        rate = (rentals[:, hour] + returns[:, hour])[None, :, None]
+        safe = np.where(rate > 0, rate, 1.0)
+        up, down = up / safe, down / safe
+
+        terms = _terms(rate)
+        k = np.arange(terms)
+        # Poisson(k; rate) weights in log space and tail masses P(N > k), per hub
+        log_weight = -rate[..., None] + k * np.log(safe[..., None]) - np.cumsum(np.log(np.maximum(k, 1)))
+        weight = np.where(rate[..., None] > 0, np.exp(log_weight), (k == 0).astype(float))
+        tail = np.clip(1 - np.cumsum(weight, axis=-1), 0.0, None)
+
+        end = np.zeros_like(dist)
+        average = np.zeros_like(dist)
+        term = dist
+        for step in range(terms):
+            end += weight[..., step] * term
+            average += tail[..., step] * term
+            # one jump of the uniformized chain: stay, move up a bike, or move down one
+            moved = term * (1 - up - down)
+            moved[..., 1:] += term[..., :-1] * up[..., :-1]
+            moved[..., :-1] += term[..., 1:] * down[..., 1:]
+            term = moved
+        average = np.where(rate > 0, average / safe, dist)
+
+        p_empty[:, :, hour] = average[..., 0]
+        p_full[:, :, hour] = np.where(at_cap, average, 0.0).sum(axis=-1)
+        dist = end / end.sum(axis=-1, keepdims=True)
+
+    return p_empty, p_full, rentals[None] * p_empty, returns[None] * p_full
@@ -0,0 +1 @@
+# lets pytest import the top-level modules from tests/
@@ -0,0 +1,170 @@
+from __future__ import annotations
+import os
+from typing import Dict, Mapping, Tuple
+import numpy as np
+import non_homogenous_poisson as nhp
+from demand_models import DemandModel
+from hourly_lambdas import DAYS
+
+"""
+Bootstrap demand from observed days. A DayArchive holds the per-hub hourly rental counts of
+every recorded day (and optionally every rental's time) as .npy files in one directory,
+opened memory-mapped, and BootstrapDemand resamples whole days from it. A replication's
+demand is a view into the archive, so cross-hub correlation on real days is kept and tens of
+thousands of replications never copy the data.
+
+    archive = DayArchive.from_log("rides.csv", num_hubs=10)
+    archive.save("archive/")
+    run_simulation(10, 5, demand_model=BootstrapDemand(DayArchive.open("archive/"), weekday="W"))
+"""
+
+_FILES = ("counts", "weekday", "dates", "times", "offsets")
+
+
+class DayArchive:
+    """ Recorded days of demand
+
+    Attributes
+    ----------
+    counts: (days, hubs, 24) int32 - rentals per day, hub and hour
+    weekday: (days,) int8 - index into DAYS of each day (5 and 6 for weekends)
+    dates: (days,) int64 - days since 1970-01-01
+    times: (events,) float32 or None - rental times in fractional hours, grouped by day and
+        hub and sorted within each group
+    offsets: (days * hubs + 1,) int64 or None - group day * hubs + hub spans
+        times[offsets[g]:offsets[g + 1]]
+    """
+    def __init__(self, counts: np.ndarray, weekday: np.ndarray, dates: np.ndarray,
+                 times: np.ndarray | None = None, offsets: np.ndarray | None = None) -> None:
+        self.counts = counts
+        self.weekday = weekday
+        self.dates = dates
+        self.times = times
+        self.offsets = offsets
+
+    @property
+    def num_days(self) -> int:
+        return self.counts.shape[0]
+
+    @property
+    def num_hubs(self) -> int:
+        return self.counts.shape[1]
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        for name in _FILES:
+            array = getattr(self, name)
+            if array is not None:
+                np.save(os.path.join(directory, name + ".npy"), array)
+
+    @classmethod
+    def open(cls, directory: str) -> DayArchive:
+        """
+        The archive saved in directory, every array memory-mapped read-only.
+        """
+        arrays = {}
+        for name in _FILES:
+            path = os.path.join(directory, name + ".npy")
+            arrays[name] = np.load(path, mmap_mode="r") if os.path.exists(path) else None
+        return cls(**arrays)
+
+    @classmethod
+    def from_log(cls, path: str, num_hubs: int, *, keep_times: bool = True, **read_args) -> DayArchive:
+        """
+        Build an archive from a rental log in one chunked pass (demand_estimator.read_chunks,
+        which read_args are passed to). Days with no rentals at all are not recorded.
+        """
+        from demand_estimator import _EPOCH_WEEKDAY, read_chunks
+        per_day: Dict[int, np.ndarray] = {}
+        chunks = []
+        for hubs, stamps in read_chunks(path, **read_args):
+            minutes = stamps.astype(np.int64)
+            days = minutes // 1440
+            hour = minutes % 1440 // 60
+            for date in np.unique(days).tolist():
+                mine = days == date
+                if date not in per_day:
+                    per_day[date] = np.zeros((num_hubs, 24), dtype=np.int32)
+                per_day[date] += np.bincount(hubs[mine] * 24 + hour[mine],
+                                             minlength=num_hubs * 24).reshape(num_hubs, 24).astype(np.int32)
+            if keep_times:
+                chunks.append((days, hubs, (minutes % 1440) / 60))
+        dates = np.array(sorted(per_day), dtype=np.int64)
+        counts = np.stack([per_day[date] for date in dates.tolist()]) if len(dates) else \
+            np.zeros((0, num_hubs, 24), dtype=np.int32)
+        weekday = ((dates + _EPOCH_WEEKDAY) % 7).astype(np.int8)
+        if not keep_times:
+            return cls(counts, weekday, dates)
+
+        if not chunks:
+            return cls(counts, weekday, dates, np.zeros(0, dtype=np.float32), np.zeros(1, dtype=np.int64))
+        days, hubs, hours = (np.concatenate(parts) for parts in zip(*chunks))
+        group = np.searchsorted(dates, days) * num_hubs + hubs
+        order = np.lexsort((hours, group))
+        offsets = np.zeros(len(dates) * num_hubs + 1, dtype=np.int64)
+        np.cumsum(np.bincount(group, minlength=len(dates) * num_hubs), out=offsets[1:])
+        return cls(counts, weekday, dates, hours[order].astype(np.float32), offsets)
+
+    def pool(self, weekday: str | None = None) -> np.ndarray:
+        """
+        Indices of the days with weekday (a DAYS letter), or of all days when None.
+        """
+        if weekday is None:
+            return np.arange(self.num_days)
+        return np.flatnonzero(np.asarray(self.weekday) == DAYS.index(weekday))
+
+    def day_times(self, index: int) -> Dict[int, np.ndarray]:
+        """
+        hub -> rental times of recorded day index, as views into the archive.
+        """
+        base = index * self.num_hubs
+        return {hub: self.times[self.offsets[base + hub]:self.offsets[base + hub + 1]]
+                for hub in range(self.num_hubs)}
+
+
+class BootstrapDemand(DemandModel):
+    """ Demand resampled from whole recorded days, with replacement
+
+    The hourly lambdas run_simulation passes are ignored: the archive is the demand.
+
+    Attributes
+    ----------
+    archive: DayArchive
+    weekday: str or None - resample only days of this DAYS letter; every recorded day when None
+    """
+    def __init__(self, archive: DayArchive, weekday: str | None = None) -> None:
+        self.archive = archive
+        self.weekday = weekday
+        self._pool = archive.pool(weekday)
+        if len(self._pool) == 0:
+            raise ValueError(f"no recorded days for weekday {weekday!r}")
+
+    def draw_days(self, reps: int, rng: np.random.Generator) -> np.ndarray:
+        """
+        Archive indices of reps resampled days.
+        """
+        return self._pool[rng.integers(len(self._pool), size=reps)]
+
+    def sample_counts(self, rates: np.ndarray, reps: int, rng: np.random.Generator) -> np.ndarray:
+        self._check_hubs(rates.shape[0])
+        return np.asarray(self.archive.counts[self.draw_days(reps, rng)], dtype=np.int64)
+
+    def build_distributions(self, hourly_lambdas, T, day, num_hubs, rng=None
+                            ) -> Tuple[Dict[int, np.ndarray], Mapping[int, np.ndarray]]:
+        """
+        One resampled day: its counts per hub and, when the archive has them, its recorded
+        rental times, all views into the archive; otherwise times uniform within each hour.
+        """
+        self._check_hubs(num_hubs)
+        if rng is None:
+            rng = np.random.default_rng()
+        index = int(self.draw_days(1, rng)[0])
+        counts = self.archive.counts[index]
+        poisson = {hub: counts[hub] for hub in range(num_hubs)}
+        if self.archive.times is not None:
+            return poisson, self.archive.day_times(index)
+        return poisson, nhp.LazyTimestamps(counts, rng)
+
+    def _check_hubs(self, num_hubs: int) -> None:
+        if num_hubs != self.archive.num_hubs:
+            raise ValueError(f"archive has {self.archive.num_hubs} hubs, the network {num_hubs}")
@@ -0,0 +1,172 @@
+from __future__ import annotations
+import argparse
+import csv
+from itertools import islice
+from typing import Dict, Iterator, Tuple
+import numpy as np
+from hourly_lambdas import DAYS
+
+"""
+Hourly rental rates estimated from raw rental logs, as the (hubs, 5, 24) lambda arrays that
+build_distributions and the scenario store take, instead of deriving them from population
+counts with hourly_lambdas' fixed divisors.
+
+A log is a CSV with one row per rental and (at least) a hub column and a start-time column.
+It is read chunk_rows rows at a time into per-(hub, day, hour) counts, so a season of logs
+is one pass in memory bounded by the chunk size. The rate of a (hub, day, hour) is its count
+divided by the number of such weekdays observed; weekend rentals are skipped.
+
+    python demand_estimator.py rides.csv --store scenarios.mbs --name fall_2025 --hour-window 1
+"""
+
+# numpy day 0 (1970-01-01) was a Thursday; (day + _EPOCH_WEEKDAY) % 7 is 0 on Mondays
+_EPOCH_WEEKDAY = 3
+
+
+class RateEstimator:
+    """ Running per-(hub, day, hour) rental counts
+
+    Attributes
+    ----------
+    counts: (hubs, 5, 24) int64 - rentals per hub, weekday (DAYS order) and hour
+    dates: set of int - days (since 1970-01-01) with at least one rental, for the exposure
+    rows: int - rentals read, weekends included
+    """
+    def __init__(self, num_hubs: int) -> None:
+        self.num_hubs = num_hubs
+        self.counts = np.zeros((num_hubs, len(DAYS), 24), dtype=np.int64)
+        self.dates: set = set()
+        self.rows = 0
+
+    def update(self, hubs: np.ndarray, times: np.ndarray) -> None:
+        """
+        Add one chunk of rentals.
+        params:
+            hubs: (rows,) hub index of each rental
+            times: (rows,) start times as datetime64 (or anything np.datetime64 parses)
+        """
+        hubs = np.asarray(hubs, dtype=np.intp)
+        minutes = np.asarray(times, dtype="datetime64[m]").astype(np.int64)
+        if hubs.size and (hubs.min() < 0 or hubs.max() >= self.num_hubs):
+            raise ValueError(f"hub index out of range for {self.num_hubs} hubs")
+        days = minutes // 1440
+        weekday = (days + _EPOCH_WEEKDAY) % 7
+        hour = minutes % 1440 // 60
+        weekdays = weekday < len(DAYS)
+        cells = (hubs * len(DAYS) + weekday)[weekdays] * 24 + hour[weekdays]
+        self.counts += np.bincount(cells, minlength=self.counts.size).reshape(self.counts.shape)
+        self.dates.update(np.unique(days[weekdays]).tolist())
+        self.rows += len(hubs)
+
+    def days_observed(self, start: str | None = None, end: str | None = None) -> np.ndarray:
+        """
+        (5,) number of Mondays, ..., Fridays observed: every one from start to end inclusive
+        when the period is given, else those with at least one rental in the log.
+        """
+        if start is None or end is None:
+            dates = np.fromiter(self.dates, dtype=np.int64)
+        else:
+            dates = np.arange(np.datetime64(start, "D").astype(np.int64),
+                              np.datetime64(end, "D").astype(np.int64) + 1)
+        weekday = (dates + _EPOCH_WEEKDAY) % 7
+        return np.bincount(weekday[weekday < len(DAYS)], minlength=len(DAYS))
+
+    def rates(
+        self,
+        *,
+        hour_window: int = 0,
+        prior_days: float = 0.0,
+        start: str | None = None,
+        end: str | None = None,
+        ) -> np.ndarray:
+        """
+        Estimated rentals per hour as a (hubs, 5, 24) lambda array.
+        keyword args:
+            hour_window: average each hour's count with hour_window hours on either side
+                (wrapping round midnight), which keeps each day's total
+            prior_days: shrink each weekday's rate toward the hub's all-weekday rate for that
+                hour, as if prior_days extra days at the pooled rate had been observed; helps
+                weekdays seen only a few times
+            start, end: the period the log covers, see days_observed
+        """
+        counts = self.counts.astype(float)
+        if hour_window > 0:
+            width = 2 * hour_window + 1
+            counts = sum(np.roll(counts, shift, axis=2) for shift in range(-hour_window, hour_window + 1)) / width
+        days = self.days_observed(start, end).astype(float)
+        pooled = counts.sum(axis=1, keepdims=True) / max(days.sum(), 1)
+        return (counts + prior_days * pooled) / np.maximum(days + prior_days, 1e-12)[None, :, None]
+
+
+def read_chunks(
+    path: str,
+    *,
+    hub_column: str = "hub",
+    time_column: str = "start_time",
+    hub_index: Dict[str, int] | None = None,
+    chunk_rows: int = 100_000,
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    (hubs, times) arrays for every chunk_rows rows of a rental log CSV. Hubs are integer
+    indices, or names looked up in hub_index (e.g. constants.location_index).
+    """
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        while True:
+            rows = list(islice(reader, chunk_rows))
+            if not rows:
+                return
+            hubs = [row[hub_column] for row in rows]
+            hubs = [hub_index[hub] for hub in hubs] if hub_index is not None else [int(hub) for hub in hubs]
+            yield np.array(hubs, dtype=np.intp), np.array([row[time_column] for row in rows], dtype="datetime64[m]")
+
+
+def estimate_rates(path: str, num_hubs: int, *, chunk_rows: int = 100_000,
+                   hub_column: str = "hub", time_column: str = "start_time",
+                   hub_index: Dict[str, int] | None = None, **smoothing) -> Tuple[np.ndarray, RateEstimator]:
+    """
+    One pass over a rental log. smoothing is passed on to RateEstimator.rates.
+    returns:
+        rates: (num_hubs, 5, 24) lambda array
+        estimator: the RateEstimator, for its counts and exposure
+    """
+    estimator = RateEstimator(num_hubs)
+    for hubs, times in read_chunks(path, hub_column=hub_column, time_column=time_column,
+                                   hub_index=hub_index, chunk_rows=chunk_rows):
+        estimator.update(hubs, times)
+    return estimator.rates(**smoothing), estimator
+
+
+if __name__ == "__main__":
+    from scenario_store import Scenario, ScenarioStore
+
+    parser = argparse.ArgumentParser(description="Estimate hourly rental rates from a rental log into a scenario store.")
+    parser.add_argument("log", help="CSV with one row per rental")
+    parser.add_argument("--store", default="scenarios.mbs", help="scenario store file to add to")
+    parser.add_argument("--name", required=True, help="scenario name in the store")
+    parser.add_argument("--hubs", type=int, default=10, help="number of hubs")
+    parser.add_argument("--hub-column", default="hub")
+    parser.add_argument("--time-column", default="start_time")
+    parser.add_argument("--hub-names", action="store_true",
+                        help="the hub column holds constants.location_index names, not indices")
+    parser.add_argument("--chunk-rows", type=int, default=100_000)
+    parser.add_argument("--hour-window", type=int, default=0, help="hours averaged on either side")
+    parser.add_argument("--prior-days", type=float, default=0.0, help="shrinkage toward the pooled weekday rate")
+    parser.add_argument("--start", help="first day the log covers (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last day the log covers (YYYY-MM-DD)")
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args()
+
+    hub_index = None
+    if args.hub_names:
+        import constants
+        hub_index = constants.location_index
+    rates, estimator = estimate_rates(args.log, args.hubs, chunk_rows=args.chunk_rows,
+                                      hub_column=args.hub_column, time_column=args.time_column,
+                                      hub_index=hub_index, hour_window=args.hour_window,
+                                      prior_days=args.prior_days, start=args.start, end=args.end)
+    meta = {"source": args.log, "rows": estimator.rows,
+            "days_observed": estimator.days_observed(args.start, args.end).tolist(),
+            "hour_window": args.hour_window, "prior_days": args.prior_days}
+    ScenarioStore(args.store).add(args.name, Scenario(rates, meta=meta), overwrite=args.overwrite)
+    print(f"{estimator.rows} rentals -> scenario {args.name!r} in {args.store}")
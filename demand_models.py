@@ -0,0 +1,169 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from typing import Dict, Mapping, Tuple
+import numpy as np
+import non_homogenous_poisson as nhp
+from hourly_lambdas import lambda_matrix
+
+"""
+Arrival models for the simulation. Every model turns a (hubs, 24) array of hourly lambdas
+into a whole (reps, hubs, 24) batch of request counts in one set of array operations, so the
+lockstep engine runs any of them at the same speed, and into the (poisson, timestamps) pair
+build_distributions returns for the per-replication engine.
+
+    PoissonDemand()                 - independent Poisson counts, what nhp gives once binned
+    NegativeBinomialDemand(k)       - overdispersed counts, variance lambda + lambda^2 / k
+    CoxDemand(shape)                - Poisson given a Gamma daily multiplier shared by all hubs
+                                      (busy days are busy everywhere)
+    HawkesDemand(branching, decay)  - self-exciting arrivals: every rental triggers more at the
+                                      same hub shortly after (groups leaving together)
+
+All of them keep the expected count of every hub-hour at its lambda (Hawkes up to the
+excitement that spills past midnight).
+
+    run_simulation(10, 5, demand_model=CoxDemand(shape=8), vectorized=True)
+"""
+
+
+class DemandModel(ABC):
+    """ Interface for arrival models; subclasses implement sample_counts """
+
+    @abstractmethod
+    def sample_counts(self, rates: np.ndarray, reps: int, rng: np.random.Generator) -> np.ndarray:
+        """
+        params:
+            rates: (hubs, 24) hourly lambdas
+            reps: number of independent days
+        returns:
+            (reps, hubs, 24) int request counts
+        """
+        raise NotImplementedError
+
+    def build_distributions(
+        self,
+        hourly_lambdas,
+        T: int,
+        day: str,
+        num_hubs: int,
+        rng: np.random.Generator | None = None,
+        ) -> Tuple[Dict[int, np.ndarray], Mapping[int, np.ndarray]]:
+        """
+        One day in the simulation_main.build_distributions layout: hub -> 24 counts, and
+        hub -> event times drawn lazily, uniform within each hour.
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        counts = self.sample_counts(lambda_matrix(hourly_lambdas, day, num_hubs), 1, rng)[0]
+        return dict(enumerate(counts)), nhp.LazyTimestamps(counts, rng)
+
+
+class PoissonDemand(DemandModel):
+    """ Independent Poisson counts per hub-hour """
+
+    def sample_counts(self, rates: np.ndarray, reps: int, rng: np.random.Generator) -> np.ndarray:
+        return rng.poisson(rates, size=(reps,) + rates.shape)
+
+
+class NegativeBinomialDemand(DemandModel):
+    """ Gamma-Poisson counts: mean lambda, variance lambda + lambda^2 / dispersion
+
+    Attributes
+    ----------
+    dispersion: float - k; smaller is more overdispersed, infinity is Poisson
+    """
+    def __init__(self, dispersion: float) -> None:
+        if dispersion <= 0:
+            raise ValueError("dispersion must be positive")
+        self.dispersion = dispersion
+
+    def sample_counts(self, rates: np.ndarray, reps: int, rng: np.random.Generator) -> np.ndarray:
+        k = self.dispersion
+        return rng.poisson(rng.gamma(k, rates / k, size=(reps,) + rates.shape))
+
+
+class CoxDemand(DemandModel):
+    """ Doubly stochastic Poisson: each day draws one Gamma(shape, 1 / shape) multiplier,
+    mean 1, that scales every hub's lambdas
+
+    Attributes
+    ----------
+    shape: float - larger means less day-to-day variation; the multiplier's variance is 1 / shape
+    """
+    def __init__(self, shape: float) -> None:
+        if shape <= 0:
+            raise ValueError("shape must be positive")
+        self.shape = shape
+
+    def multipliers(self, reps: int, rng: np.random.Generator) -> np.ndarray:
+        return rng.gamma(self.shape, 1 / self.shape, size=reps)
+
+    def sample_counts(self, rates: np.ndarray, reps: int, rng: np.random.Generator) -> np.ndarray:
+        scale = self.multipliers(reps, rng)
+        return rng.poisson(scale[:, None, None] * rates[None, :, :])
+
+
+class HawkesDemand(DemandModel):
+    """ Self-exciting arrivals per hub, simulated by their cluster (branching) form
+
+    Background rentals arrive at branching-reduced rates lambda * (1 - branching), uniform
+    within each hour. Every rental triggers Poisson(branching) more rentals at the same hub,
+    each after an exponential delay of mean 1 / decay hours, and those trigger their own, so
+    rentals come in bursts while the long-run hourly mean stays lambda.
+
+    Attributes
+    ----------
+    branching: float in [0, 1) - expected rentals triggered by each rental
+    decay: float - excitement decay rate per hour (60 means followers within about a minute)
+    """
+    def __init__(self, branching: float, decay: float = 60.0) -> None:
+        if not 0 <= branching < 1:
+            raise ValueError("branching must be in [0, 1)")
+        if decay <= 0:
+            raise ValueError("decay must be positive")
+        self.branching = branching
+        self.decay = decay
+
+    def events(self, rates: np.ndarray, reps: int, rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Every rental of a batch of days, one generation of followers at a time.
+        returns:
+            cell: (events,) flat index rep * hubs + hub of each rental
+            times: (events,) its time in fractional hours
+        """
+        num_hubs, hours = rates.shape
+        background = rng.poisson(rates * (1 - self.branching), size=(reps, num_hubs, hours))
+        flat = np.repeat(np.arange(background.size), background.reshape(-1))
+        cell, hour = np.divmod(flat, hours)
+        times = hour + rng.random(len(flat))
+        all_cells, all_times = [cell], [times]
+        while len(cell):
+            children = rng.poisson(self.branching, size=len(cell))
+            cell = np.repeat(cell, children)
+            times = np.repeat(times, children) + rng.exponential(1 / self.decay, size=len(cell))
+            inside = times < hours
+            cell, times = cell[inside], times[inside]
+            all_cells.append(cell)
+            all_times.append(times)
+        return np.concatenate(all_cells), np.concatenate(all_times)
+
+    def sample_counts(self, rates: np.ndarray, reps: int, rng: np.random.Generator) -> np.ndarray:
+        num_hubs, hours = rates.shape
+        cell, times = self.events(rates, reps, rng)
+        bins = cell * hours + times.astype(np.intp)
+        return np.bincount(bins, minlength=reps * num_hubs * hours).reshape(reps, num_hubs, hours)
+
+    def build_distributions(self, hourly_lambdas, T, day, num_hubs, rng=None):
+        """
+        As DemandModel.build_distributions, with the simulated (bursty) times instead of
+        uniform ones.
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        rates = lambda_matrix(hourly_lambdas, day, num_hubs)
+        cell, times = self.events(rates, 1, rng)
+        order = np.lexsort((times, cell))
+        cell, times = cell[order], times[order]
+        bounds = np.searchsorted(cell, np.arange(num_hubs + 1))
+        timestamps = {hub: times[bounds[hub]:bounds[hub + 1]] for hub in range(num_hubs)}
+        poisson = {hub: np.bincount(timestamps[hub].astype(np.intp), minlength=T)[:T] for hub in range(num_hubs)}
+        return poisson, timestamps
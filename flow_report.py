@@ -0,0 +1,118 @@
+from __future__ import annotations
+import argparse
+import csv
+import sys
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+from fluid_model import as_destination_tensor, expected_inflow
+from hourly_lambdas import DAYS, lambda_array
+
+"""
+Expected origin-destination flows and net imbalance per hub, day and hour, without
+simulating. The (hubs, days, 24) lambdas are contracted with the (24, hubs, hubs)
+destination tensor, and each trip is shifted by its ceil(travel / 60) hours, for every day
+at once. Every requested rental is assumed to happen, so this is where stock drains or piles
+up before any stockout cuts demand off.
+
+    report = expected_flows(travel_time, converted_population, build_probabilities(10))
+    report.ranked(5)   # e.g. student_center in the morning
+"""
+
+FIELDS = ("hub", "day", "hour", "inflow", "outflow", "net")
+
+
+class FlowReport:
+    """ Result of expected_flows
+
+    Attributes
+    ----------
+    inflow: (hubs, days, 24) - expected bikes docking at the hub during the hour
+    outflow: (hubs, days, 24) - expected rentals leaving the hub during the hour (lambdas)
+    net: (hubs, days, 24) - inflow - outflow, negative where stock drains
+    names: list of str - hub names, index i is hub i
+    days: list of str - day labels along the day axis
+    """
+    def __init__(self, inflow: np.ndarray, outflow: np.ndarray, names: Sequence[str], days: Sequence[str]) -> None:
+        self.inflow = inflow
+        self.outflow = outflow
+        self.net = inflow - outflow
+        self.names = list(names)
+        self.days = list(days)
+
+    def ranked(self, top: int = 10) -> List[Tuple[str, str, int, float]]:
+        """
+        The top most imbalanced hub-hours by |net|, largest first.
+        returns:
+            (hub name, day, hour, net) tuples
+        """
+        size = self.net.size
+        top = min(top, size)
+        if top <= 0:
+            return []
+        flat = np.abs(self.net).ravel()
+        picked = np.argpartition(-flat, top - 1)[:top] if top < size else np.arange(size)
+        picked = picked[np.argsort(-flat[picked], kind="stable")]
+        hubs, days, hours = np.unravel_index(picked, self.net.shape)
+        return [(self.names[hub], self.days[day], int(hour), float(self.net[hub, day, hour]))
+                for hub, day, hour in zip(hubs.tolist(), days.tolist(), hours.tolist())]
+
+    def rows(self, top: int | None = None) -> List[Dict[str, object]]:
+        """
+        FIELDS rows for every hub-hour, or only the top ranked ones.
+        """
+        if top is None:
+            cells = np.ndindex(self.net.shape)
+        else:
+            lookup = {name: index for index, name in enumerate(self.names)}
+            cells = [(lookup[hub], self.days.index(day), hour) for hub, day, hour, _ in self.ranked(top)]
+        return [{"hub": self.names[hub], "day": self.days[day], "hour": hour,
+                 "inflow": float(self.inflow[hub, day, hour]), "outflow": float(self.outflow[hub, day, hour]),
+                 "net": float(self.net[hub, day, hour])} for hub, day, hour in cells]
+
+
+def expected_flows(
+    travel: np.ndarray,
+    lambdas,
+    possibilities,
+    names: Sequence[str] | None = None,
+    ) -> FlowReport:
+    """
+    Parameters:
+    travel - (hubs, hubs) travel time in minutes
+    lambdas - (hubs, days, 24) lambda array or a converted_population-style dictionary
+    possibilities - destination probabilities in any form simulation() accepts, or a
+        (24, hubs, hubs) destination_tensor (see fluid_model.as_destination_tensor)
+    names - hub names, indices as strings when omitted
+
+    Returns:
+    FlowReport with inflow, outflow and net per hub, day and hour
+    """
+    travel = np.asarray(travel)
+    lambdas = np.asarray(lambdas, dtype=float) if isinstance(lambdas, np.ndarray) else lambda_array(lambdas)
+    num_hubs = travel.shape[0]
+    lambdas = lambdas[:num_hubs]
+    tensor = as_destination_tensor(possibilities, num_hubs)
+
+    # expected_inflow wants hubs next to hours: (days, hubs, 24) and back
+    inflow = np.moveaxis(expected_inflow(travel, np.moveaxis(lambdas, 1, 0), tensor), 0, 1)
+    days = DAYS if lambdas.shape[1] == len(DAYS) else [str(day) for day in range(lambdas.shape[1])]
+    if names is None:
+        names = [str(hub) for hub in range(num_hubs)]
+    return FlowReport(inflow, lambdas, names, days)
+
+
+if __name__ == "__main__":
+    from constants import location_index, travel_time
+    from converted_population import converted_population
+    from simulation_main import build_probabilities
+
+    parser = argparse.ArgumentParser(description="Expected inflow, outflow and net imbalance per hub-hour.")
+    parser.add_argument("--top", type=int, default=10, help="rank this many hub-hours; 0 writes every hub-hour")
+    args = parser.parse_args()
+
+    num_hubs = travel_time.shape[0]
+    names = sorted(location_index, key=location_index.get)
+    report = expected_flows(travel_time, converted_population, build_probabilities(num_hubs), names)
+    writer = csv.DictWriter(sys.stdout, fieldnames=FIELDS)
+    writer.writeheader()
+    writer.writerows(report.rows(args.top or None))
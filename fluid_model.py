@@ -0,0 +1,152 @@
+from __future__ import annotations
+from typing import Tuple
+import numpy as np
+from batch_simulation import DestinationTable, arrival_steps
+
+"""
+Deterministic fluid approximation of the simulation, for screening stock/capacity
+configurations before running Monte Carlo. Demand, bikes and trips are expected values
+(real numbers) and each hour follows the rules of simulation_code.simulation on them:
+    - bikes due this hour dock up to the free space; the excess is no-parking volume and
+      rides on to the nearest hub with space after docking (or waits an hour)
+    - served rentals are min(stock, lambda), the rest is no-bike volume
+    - served rentals leave along the destination probabilities and dock ceil(t / 60) hours
+      later; trips back to their own hub leave the system
+Every configuration is one row of the state, so thousands of configurations are a few
+small matrix products per hour. Because it uses expected demand it misses the stockouts
+that only randomness causes, and undercounts near the capacity limits; use it to rank and
+prune, then run Monte Carlo on the survivors.
+
+    no_bike, no_parking = fluid_simulation(travel_time, lambda_matrix(lambdas, "W", 10),
+                                           build_probabilities(10), stocks, capacities)
+"""
+
+
+def destination_tensor(possibilities, num_hubs: int) -> np.ndarray:
+    """
+    (24, hubs, hubs) probability that a rental at origin during hour goes to destination,
+    with simulation()'s normalization and uniform fallback for all-zero rows. possibilities
+    is anything simulation() accepts.
+    """
+    table = possibilities if isinstance(possibilities, DestinationTable) else DestinationTable(possibilities, num_hubs)
+    tensor = np.zeros((24, num_hubs, num_hubs))
+    for hour in range(24):
+        for hub in range(num_hubs):
+            dests, probs = table.row(hub, hour)
+            tensor[hour, hub, dests] = probs
+    return tensor
+
+
+def as_destination_tensor(possibilities, num_hubs: int) -> np.ndarray:
+    """
+    possibilities as a (24, hubs, hubs) destination_tensor. An array of exactly that shape is
+    taken as one already; anything else, including a (hubs, 24, hubs) array, goes through
+    destination_tensor. With 24 hubs the two layouts look alike, so a 24-hub array is read in
+    simulation()'s (hubs, 24, hubs) layout.
+    """
+    if isinstance(possibilities, np.ndarray) and possibilities.shape == (24, num_hubs, num_hubs) \
+            and num_hubs != 24:
+        return possibilities
+    return destination_tensor(possibilities, num_hubs)
+
+
+def expected_inflow(travel: np.ndarray, lambdas: np.ndarray, tensor: np.ndarray) -> np.ndarray:
+    """
+    Expected bikes docking at each hub each hour if every requested rental happened:
+    departures lambdas[o, h] * tensor[h, o, d] dock ceil(travel[o, d] / 60) hours later,
+    trips back to their own hub and trips still out at midnight are dropped, as in simulation().
+    params:
+        lambdas: (..., hubs, 24) hourly rental lambdas, any leading axes (e.g. days)
+        tensor: (24, hubs, hubs) destination_tensor
+    returns:
+        (..., hubs, 24) expected arrivals per destination hub and hour
+    """
+    num_hubs = tensor.shape[1]
+    steps = arrival_steps(travel)
+    tensor = tensor * (1 - np.eye(num_hubs))
+    inflow = np.zeros(np.shape(lambdas))
+    for delay in np.unique(steps[~np.eye(num_hubs, dtype=bool)]):
+        if delay >= 24:
+            continue
+        flow = np.einsum("...oh,hod->...dh", lambdas, tensor * (steps == delay))
+        inflow[..., delay:] += flow[..., :24 - delay]
+    return inflow
+
+
+def _per_hub(values, num_hubs: int) -> np.ndarray:
+    # a scalar, one value per configuration, or one per configuration and hub, as (configs, hubs)
+    values = np.asarray(values, dtype=float)
+    if values.ndim < 2:
+        values = values.reshape(-1, 1)
+    return np.broadcast_to(values, (values.shape[0], num_hubs))
+
+
+def fluid_simulation(
+    travel: np.ndarray,
+    lambdas: np.ndarray,
+    possibilities,
+    initial_bikes_per_hub,
+    max_bikes_per_hub,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Parameters:
+    travel - (hubs, hubs) travel time in minutes
+    lambdas - (hubs, 24) expected rentals per hub and hour, e.g. hourly_lambdas.lambda_matrix
+    possibilities - destination probabilities in any form simulation() accepts, or a
+        (24, hubs, hubs) destination_tensor (see as_destination_tensor)
+    initial_bikes_per_hub, max_bikes_per_hub - (configs,) or (configs, hubs) initial stock and
+        capacity of every configuration; a scalar is a single configuration
+
+    Returns:
+    no_bike - (configs, 24) expected no-bike volume per configuration and hour
+    no_parking - (configs, 24) expected no-parking volume per configuration and hour
+    """
+    travel = np.asarray(travel)
+    lambdas = np.asarray(lambdas, dtype=float)
+    num_hubs = travel.shape[0]
+    tensor = as_destination_tensor(possibilities, num_hubs)
+    tensor = tensor * (1 - np.eye(num_hubs))  # trips back to their own hub leave the system
+
+    stock, capacity = np.broadcast_arrays(_per_hub(initial_bikes_per_hub, num_hubs),
+                                          _per_hub(max_bikes_per_hub, num_hubs))
+    stock = stock.copy()
+    configs = stock.shape[0]
+
+    steps = arrival_steps(travel)
+    horizon = int(steps.max()) + 1
+    # the hour's destination matrix split by how many hours the trip takes
+    delays = np.unique(steps[~np.eye(num_hubs, dtype=bool)])
+    nearest = [order[order != hub] for hub, order in enumerate(np.argsort(travel, axis=1, kind="stable"))]
+
+    pending = np.zeros((horizon, configs, num_hubs))
+    no_bike = np.zeros((configs, 24))
+    no_parking = np.zeros((configs, 24))
+    rows = np.arange(configs)
+
+    for hour in range(24):
+        slot = hour % horizon
+        arrivals = pending[slot].copy()
+        pending[slot] = 0.0
+
+        docked = np.minimum(arrivals, np.maximum(capacity - stock, 0.0))
+        overflow = arrivals - docked
+        stock += docked
+        no_parking[:, hour] = overflow.sum(axis=1)
+
+        if overflow.any():
+            has_space = stock < capacity
+            for dest in np.flatnonzero(overflow.any(axis=0)):
+                open_hubs = has_space[:, nearest[dest]]
+                found = open_hubs.any(axis=1)
+                target = np.where(found, nearest[dest][open_hubs.argmax(axis=1)], dest)
+                wait = np.where(found, steps[dest, target], 1)
+                np.add.at(pending, ((hour + wait) % horizon, rows, target), overflow[:, dest])
+
+        served = np.minimum(stock, lambdas[:, hour])
+        no_bike[:, hour] = (lambdas[:, hour] - served).sum(axis=1)
+        stock -= served
+
+        for delay in delays:
+            pending[(hour + delay) % horizon] += served @ (tensor[hour] * (steps == delay))
+
+    return no_bike, no_parking
@@ -1,12 +1,13 @@
+from __future__ import annotations
 import numpy as np
 from typing import Dict
-from testdata import size_dictionary
 import json
+from seeding import SeedStreams
 
-rng = np.random.default_rng()
 def hourly_lambdas(
     population_distribution: Dict[int, Dict[str, Dict[str, int]]],
     prob: float,
+    rng: np.random.Generator | None = None,
 ) -> Dict[int, Dict[str, Dict[str, int]]]:
     """
     Generate hourly lambda values using Poisson sampling for variability.
@@ -17,6 +18,9 @@ def hourly_lambdas(
         ["0","1",...,n=24]. The values of each hour represent a certain number of people. So returning one value from
         this dictionary would tell you the number of people at a certain hour at a certain hub on a certain day of the week. See 
         test_data.py's size_dictionary for reference.
+        prob: share of the people around a hub that request a bike
+        rng: generator for the Poisson draws, e.g. SeedStreams(seed).generator("lambdas");
+            fresh entropy when None
     return:
         lambdas: dictinionary of the same structure as population_distribution
         containing the distribution of bike rental requests at each hub on a certain day of the week. However, the 
@@ -24,6 +28,8 @@ def hourly_lambdas(
     """
     if not (0.0 < prob <= 1.0):
         raise ValueError("prob must be in (0, 1]")
+    if rng is None:
+        rng = np.random.default_rng()
     lambdas: Dict[int, Dict[str, Dict[str, int]]] = {}
 
     for hub_id, days in population_distribution.items():
@@ -41,6 +47,46 @@ def hourly_lambdas(
                 lambdas[hub_id][day][hour] = lam
     return lambdas
 
+# days of the week in the order of the day axis of every lambda array
+DAYS = ("M", "T", "W", "R", "F")
+
+
+def lambda_array(hourly_lambdas: Dict[int, Dict[str, Dict[int, int]]]) -> np.ndarray:
+    """
+    A converted_population-style dictionary as a (hubs, 5, 24) float array, hubs in numeric
+    order (int or str keys, as hourly_lambdas returns them) and days in DAYS order.
+    """
+    return np.array([[list(hourly_lambdas[hub][day].values()) for day in DAYS]
+                     for hub in sorted(hourly_lambdas, key=int)], dtype=float)
+
+
+def lambdas_from_array(array: np.ndarray) -> Dict[int, Dict[str, Dict[int, float]]]:
+    """
+    Inverse of lambda_array: a (hubs, 5, 24) array in the converted_population layout.
+    Whole-number arrays give int values, like converted_population itself.
+    """
+    array = np.asarray(array)
+    if np.array_equal(array, np.round(array)):
+        array = array.astype(int)
+    return {hub: {day: dict(enumerate(array[hub, d].tolist())) for d, day in enumerate(DAYS)}
+            for hub in range(array.shape[0])}
+
+
+def lambda_matrix(
+    hourly_lambdas: Dict[int, Dict[str, Dict[int, int]]] | np.ndarray,
+    day: str,
+    num_hubs: int,
+) -> np.ndarray:
+    """
+    One day of a converted_population-style dictionary as a (num_hubs, 24) float array,
+    hours in the dictionary's order (the order nhp reads them in). A (hubs, 5, 24) lambda
+    array (lambda_array, scenario_store, demand_estimator) is sliced instead.
+    """
+    if isinstance(hourly_lambdas, np.ndarray):
+        return hourly_lambdas[:num_hubs, DAYS.index(day)].astype(float)
+    return np.array([list(hourly_lambdas[hub][day].values()) for hub in range(num_hubs)], dtype=float)
+
+
 #VERY IMPORTANT COMMENT
 #new hourly lambdas dictinoary is written to a new file called CONVERTED_POPULATION.PY
 def write_converted_population_file(data: Dict[int, Dict[str, Dict[str, int]]], filename):
@@ -68,15 +114,30 @@ def write_converted_population_file(data: Dict[int, Dict[str, Dict[str, int]]],
 
 
 if __name__ == "__main__":
+    import argparse
+    from scenario_store import Scenario, ScenarioStore
+    from testdata import size_dictionary
+
+    parser = argparse.ArgumentParser(description="Draw hourly lambdas from size_dictionary into a scenario store.")
+    parser.add_argument("--store", default="scenarios.mbs", help="scenario store file to add to")
+    parser.add_argument("--name", default="weekday", help="scenario name in the store")
+    parser.add_argument("--prob", type=float, default=0.1, help="share of the people around a hub that request a bike")
+    parser.add_argument("--seed", type=int, default=None, help="root seed; fresh entropy when omitted")
+    parser.add_argument("--overwrite", action="store_true", help="replace an existing scenario of that name")
+    parser.add_argument("--module", help="also write the lambdas as a converted_population.py-style module here")
+    args = parser.parse_args()
 
-    rng = np.random.default_rng()
+    # one lambdas stream for the whole file, so a seed reproduces the scenario
+    streams = SeedStreams(args.seed)
+    rng = streams.generator("lambdas")
     combined_result = {}
     for hub_id, data in size_dictionary.items():
-        prob = 0.1 if hub_id in ["0", "2", "8"] else 0.1
-        hub_result = hourly_lambdas({hub_id: data}, prob)
+        hub_result = hourly_lambdas({hub_id: data}, args.prob, rng)
         combined_result[hub_id] = hub_result[hub_id]
 
-
-    # Write combined result to file
-    write_converted_population_file(combined_result, "/Users/zachokaylimasaryk/Downloads/middbike/middbike/converted_population.py")
-
+    ScenarioStore(args.store).add(
+        args.name, Scenario.from_lambdas(combined_result, meta={"prob": args.prob, "seed": streams.entropy}),
+        overwrite=args.overwrite)
+    print(f"Scenario {args.name!r} has been written to {args.store}")
+    if args.module:
+        write_converted_population_file(combined_result, args.module)
@@ -0,0 +1,270 @@
+from __future__ import annotations
+import argparse
+import csv
+import sys
+from typing import Dict, List, Sequence
+import numpy as np
+import batch_simulation as batch
+import new_probability as nwp
+from demand_models import DemandModel, PoissonDemand
+from hourly_lambdas import DAYS, lambda_matrix
+from network_generator import Network
+from seeding import SeedStreams
+from simulation_main import build_probabilities
+
+"""
+What-if evaluation of opening a candidate hub or closing an existing one. remove_hub and
+add_hub return a new Network with travel_time, elevation_matrix, sizes, lambdas and the
+destination blocks re-sliced or extended consistently:
+    - closing hub h drops its row and column everywhere and renormalizes each source's
+      destination row over the hubs left, which is exact for a multinomial logit
+    - opening hub c gives each source's row a share r / (1 + r) for c, where r is c's
+      multinomial logit weight relative to the existing destinations at the block's mean
+      sizes, and scales the old entries by 1 / (1 + r); c's own row is the logit over the
+      existing hubs, as in generate_network. Blocks that are all zero (the night block)
+      stay zero
+Demand at the other hubs is left as it is.
+
+HubWhatIf draws the baseline's request counts once, for every replication, and each variant
+reuses them: a closure drops the hub's slice, an opening appends the candidate's own draws.
+Destination draws start from the same stream in every variant. Every variant is then one
+lockstep simulate_batch run, and the differences to the baseline are paired per
+replication, so their noise is far below that of two independent sweeps.
+
+    whatif = HubWhatIf(middlebury_network(), replications=500, seed=1)
+    whatif.leave_one_out()
+    whatif.add(Candidate("library", travel_from, travel_to, elevation_from, elevation_to, sizes))
+"""
+
+FIELDS = ("variant", "no_bike", "no_parking", "delta_no_bike", "delta_no_parking",
+          "delta_no_bike_se", "delta_no_parking_se")
+
+
+class Candidate:
+    """ A hub that could be opened
+
+    Attributes
+    ----------
+    name: str
+    travel_from, travel_to: (hubs,) - minutes from the candidate to every existing hub and back
+    elevation_from, elevation_to: (hubs,) - elevation difference from the candidate to every
+        existing hub and back
+    sizes: (5, 24) - people around the candidate per day (DAYS order) and hour
+    lambdas: (5, 24) - rental requests per day and hour, sizes / 8 * prob when None
+    """
+    def __init__(self, name: str, travel_from: np.ndarray, travel_to: np.ndarray,
+                 elevation_from: np.ndarray, elevation_to: np.ndarray, sizes: np.ndarray,
+                 lambdas: np.ndarray | None = None, prob: float = 0.1) -> None:
+        self.name = name
+        self.travel_from = np.asarray(travel_from)
+        self.travel_to = np.asarray(travel_to)
+        self.elevation_from = np.asarray(elevation_from)
+        self.elevation_to = np.asarray(elevation_to)
+        self.sizes = np.asarray(sizes, dtype=float)
+        self.lambdas = self.sizes / 8 * prob if lambdas is None else np.asarray(lambdas, dtype=float)
+
+
+def _hub_index(network: Network, hub: int | str) -> int:
+    return network.names.index(hub) if isinstance(hub, str) else int(hub)
+
+
+def _dense_blocks(network: Network) -> np.ndarray:
+    if network.blocks is None:
+        raise ValueError("hub what-ifs need dense destination blocks; build the network without top_k")
+    return np.asarray(network.blocks, dtype=float)
+
+
+def remove_hub(network: Network, hub: int | str) -> Network:
+    """
+    network without hub (an index or a name); every source's destination row is
+    renormalized over the remaining hubs to the total it had before.
+    """
+    hub = _hub_index(network, hub)
+    keep = np.delete(np.arange(network.num_hubs), hub)
+    blocks = _dense_blocks(network)[:, keep][:, :, keep]
+    before = _dense_blocks(network)[:, keep].sum(axis=2, keepdims=True)
+    after = blocks.sum(axis=2, keepdims=True)
+    blocks = np.where(after > 0, blocks * before / np.where(after > 0, after, 1.0), 0.0)
+    return Network([network.names[i] for i in keep], network.travel_time[np.ix_(keep, keep)],
+                   network.elevation_matrix[np.ix_(keep, keep)], network.sizes[keep],
+                   network.lambda_array[keep], blocks)
+
+
+def add_hub(
+    network: Network,
+    candidate: Candidate,
+    *,
+    beta1: float = 0.25,
+    beta2: float = 0.25,
+    lnSize: float = 0.75,
+    ) -> Network:
+    """
+    network with candidate appended as the last hub. beta1, beta2 and lnSize weigh travel
+    time, elevation and log size in the logit that places the candidate among the existing
+    destinations, as in generate_network.
+    """
+    n = network.num_hubs
+    travel = np.zeros((n + 1, n + 1), dtype=np.result_type(network.travel_time, candidate.travel_from))
+    travel[:n, :n] = network.travel_time
+    travel[n, :n] = candidate.travel_from
+    travel[:n, n] = candidate.travel_to
+    elevation = np.zeros((n + 1, n + 1), dtype=np.result_type(network.elevation_matrix, candidate.elevation_from))
+    elevation[:n, :n] = network.elevation_matrix
+    elevation[n, :n] = candidate.elevation_from
+    elevation[:n, n] = candidate.elevation_to
+    sizes = np.concatenate([network.sizes, candidate.sizes[None]])
+    lambdas = np.concatenate([network.lambda_array, candidate.lambdas[None]])
+
+    old = _dense_blocks(network)
+    blocks = np.zeros((len(old), n + 1, n + 1))
+    blocks[:, :n, :n] = old
+    for block in range(len(old)):
+        if not old[block].any():
+            continue
+        hours = np.flatnonzero(nwp.HOUR_TO_BLOCK == block)
+        log_size = np.log(np.maximum(sizes[:, :, hours].mean(axis=(1, 2)), 1))
+        util = -beta1 * travel - beta2 * elevation + lnSize * log_size[None, :]
+        util[np.arange(n + 1), np.arange(n + 1)] = -np.inf
+        util -= util.max(axis=1, keepdims=True)
+        weight = np.exp(util)
+        # the candidate's weight relative to the existing destinations of each source
+        ratio = weight[:n, n] / weight[:n, :n].sum(axis=1)
+        has_row = old[block].sum(axis=1) > 0
+        ratio = np.where(has_row, ratio, 0.0)
+        blocks[block, :n, :n] /= (1 + ratio)[:, None]
+        blocks[block, :n, n] = ratio / (1 + ratio) * old[block].sum(axis=1)
+        blocks[block, n, :n] = weight[n, :n] / weight[n, :n].sum()
+
+    return Network(network.names + [candidate.name], travel, elevation, sizes, lambdas, blocks)
+
+
+class WhatIfResult:
+    """ One variant against the baseline, per simulated day
+
+    Attributes
+    ----------
+    variant: str - "baseline", "-name" for a closure or "+name" for an opening
+    network: Network - the variant's network
+    no_bike, no_parking: float - mean events per day
+    delta_no_bike, delta_no_parking: float - mean paired difference to the baseline
+    delta_no_bike_se, delta_no_parking_se: float - standard error of those differences
+    """
+    def __init__(self, variant: str, network: Network, no_bike: np.ndarray, no_parking: np.ndarray,
+                 base_no_bike: np.ndarray, base_no_parking: np.ndarray) -> None:
+        self.variant = variant
+        self.network = network
+        self.no_bike = float(no_bike.mean())
+        self.no_parking = float(no_parking.mean())
+        reps = len(no_bike)
+        diff_bike = no_bike - base_no_bike
+        diff_parking = no_parking - base_no_parking
+        self.delta_no_bike = float(diff_bike.mean())
+        self.delta_no_parking = float(diff_parking.mean())
+        self.delta_no_bike_se = float(diff_bike.std(ddof=1) / np.sqrt(reps)) if reps > 1 else float("nan")
+        self.delta_no_parking_se = float(diff_parking.std(ddof=1) / np.sqrt(reps)) if reps > 1 else float("nan")
+
+    def row(self) -> Dict[str, object]:
+        return {field: getattr(self, field) for field in FIELDS}
+
+    def __repr__(self) -> str:
+        return (f"WhatIfResult({self.variant}: no_bike={self.no_bike:.2f} ({self.delta_no_bike:+.2f}), "
+                f"no_parking={self.no_parking:.2f} ({self.delta_no_parking:+.2f}))")
+
+
+class HubWhatIf:
+    """ Hub closures and openings evaluated on common random numbers
+
+    Attributes
+    ----------
+    network: Network - the baseline network
+    demand: (reps, hubs, 24) int - the baseline's request counts, shared by every variant
+    baseline: WhatIfResult - the baseline itself
+    """
+    def __init__(self,
+                 network: Network,
+                 *,
+                 day: str = "W",
+                 replications: int = 200,
+                 max_bikes_per_hub: int = 10,
+                 initial_bikes_per_hub: int = 5,
+                 seed: int | SeedStreams | None = None,
+                 demand_model: DemandModel | None = None,
+                ) -> None:
+        if day not in DAYS:
+            raise ValueError(f"unknown day {day!r}, expected one of {DAYS}")
+        self.network = network
+        self.day = day
+        self.replications = replications
+        self.max_bikes_per_hub = max_bikes_per_hub
+        self.initial_bikes_per_hub = initial_bikes_per_hub
+        self.streams = seed if isinstance(seed, SeedStreams) else SeedStreams(seed)
+        self.demand_model = PoissonDemand() if demand_model is None else demand_model
+        lam = lambda_matrix(network.lambda_array, day, network.num_hubs)
+        self.demand = self.demand_model.sample_counts(lam, replications, self.streams.generator("arrivals"))
+        self._base = self._simulate(network, self.demand)
+        self.baseline = WhatIfResult("baseline", network, *self._base, *self._base)
+
+    def _simulate(self, network: Network, demand: np.ndarray):
+        no_bike, no_parking = batch.simulate_batch(
+            network.travel_time, demand, build_probabilities(network.num_hubs, network.blocks),
+            max_bikes_per_hub=self.max_bikes_per_hub, initial_bikes_per_hub=self.initial_bikes_per_hub,
+            rng=self.streams.generator("destinations"))
+        return no_bike.sum(axis=1), no_parking.sum(axis=1)
+
+    def remove(self, hub: int | str) -> WhatIfResult:
+        """
+        The baseline with hub closed; its requests are dropped, every other hub sees the
+        baseline's requests.
+        """
+        index = _hub_index(self.network, hub)
+        network = remove_hub(self.network, index)
+        demand = np.delete(self.demand, index, axis=1)
+        return WhatIfResult(f"-{self.network.names[index]}", network, *self._simulate(network, demand), *self._base)
+
+    def add(self, candidate: Candidate, **logit) -> WhatIfResult:
+        """
+        The baseline with candidate opened. The existing hubs see the baseline's requests;
+        the candidate's come from a stream keyed by its name, so the same candidate gives
+        the same result however often and in whatever order it is added. logit goes to add_hub.
+        """
+        network = add_hub(self.network, candidate, **logit)
+        lam = lambda_matrix(network.lambda_array[-1:], self.day, 1)
+        # keyed by the candidate's name: independent of the baseline's draws and of the
+        # order candidates are tried in
+        rng = self.streams.keyed(f"candidate:{candidate.name}").generator("arrivals")
+        extra = self.demand_model.sample_counts(lam, self.replications, rng)
+        demand = np.concatenate([self.demand, extra], axis=1)
+        return WhatIfResult(f"+{candidate.name}", network, *self._simulate(network, demand), *self._base)
+
+    def leave_one_out(self, hubs: Sequence[int | str] | None = None) -> List[WhatIfResult]:
+        """
+        remove for each of hubs, every hub when None.
+        """
+        hubs = range(self.network.num_hubs) if hubs is None else hubs
+        return [self.remove(hub) for hub in hubs]
+
+    def add_each(self, candidates: Sequence[Candidate], **logit) -> List[WhatIfResult]:
+        """
+        add for each candidate on its own.
+        """
+        return [self.add(candidate, **logit) for candidate in candidates]
+
+
+if __name__ == "__main__":
+    from network_generator import middlebury_network
+
+    parser = argparse.ArgumentParser(description="Close each Middlebury hub in turn and compare with the baseline.")
+    parser.add_argument("--day", default="W", choices=DAYS)
+    parser.add_argument("--replications", type=int, default=200)
+    parser.add_argument("--stock", type=int, default=5)
+    parser.add_argument("--capacity", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    whatif = HubWhatIf(middlebury_network(), day=args.day, replications=args.replications,
+                       max_bikes_per_hub=args.capacity, initial_bikes_per_hub=args.stock, seed=args.seed)
+    writer = csv.DictWriter(sys.stdout, fieldnames=FIELDS)
+    writer.writeheader()
+    writer.writerow(whatif.baseline.row())
+    for result in whatif.leave_one_out():
+        writer.writerow(result.row())
@@ -0,0 +1,191 @@
+from __future__ import annotations
+from typing import Dict, Tuple
+import numpy as np
+from hourly_lambdas import DAYS
+
+"""
+Incremental multinomial logit destination probabilities. Same model as
+hourly_usage_and_probability:
+
+    utility(s, d, day, hour) = -beta1 * travel[s, d] - beta2 * elevation[s, d]
+                               + lnSize * log(max(size[d, day, hour], 1))
+    probability = exp(utility) / sum over destinations of exp(utility)
+
+but the log of every denominator (one per source, day and hour) is kept, so a change to one
+input only touches the entries it affects:
+    - one size entry (destination d, day, hour): one term of the denominator of every
+      source at that day and hour, O(hubs)
+    - a destination's whole size profile: O(hubs * 120)
+    - one source row of travel time or elevation: that source's denominators, O(hubs * 120)
+instead of the O(hubs^2 * 120) full recompute.
+
+    mnl = IncrementalMNL(travel_time, elevation_matrix, size_array(size_dictionary))
+    mnl.set_size(3, "T", 10, 250)
+    mnl.probability(8, 1, "T", 10)
+"""
+
+# a removed term that held more than this share of its denominator is not subtracted
+# (the difference would lose precision); the denominator is recomputed instead
+_CANCEL_SHARE = 1 - 1e-6
+
+
+class IncrementalMNL:
+    """ Multinomial logit over destinations with cached log denominators
+
+    Attributes
+    ----------
+    travel: (hubs, hubs) float - travel minutes, rows are sources
+    elevation: (hubs, hubs) float - elevation difference from source to destination
+    log_size: (hubs, 120) float - log(max(size, 1)) per destination and day * 24 + hour
+    beta1, beta2, lnSize: float - utility weights
+    exclude_self: bool - leave the source out of its own choice set, as generate_network does;
+        hourly_usage_and_probability keeps it in, which is the default
+    """
+    def __init__(self,
+                 travel: np.ndarray,
+                 elevation: np.ndarray,
+                 sizes: np.ndarray,
+                 *,
+                 beta1: float = 0.25,
+                 beta2: float = 0.25,
+                 lnSize: float = 0.75,
+                 exclude_self: bool = False,
+                ) -> None:
+        """
+        sizes: (hubs, 5, 24) people around each hub per day (DAYS order) and hour,
+            e.g. network_generator.size_array(size_dictionary)
+        """
+        self.travel = np.array(travel, dtype=float)
+        self.elevation = np.array(elevation, dtype=float)
+        sizes = np.asarray(sizes, dtype=float)
+        self.num_hubs = self.travel.shape[0]
+        if sizes.shape != (self.num_hubs, len(DAYS), 24):
+            raise ValueError(f"sizes must be ({self.num_hubs}, {len(DAYS)}, 24), got {sizes.shape}")
+        self.log_size = np.log(np.maximum(sizes, 1)).reshape(self.num_hubs, -1)
+        self.exclude_self = exclude_self
+        self.set_params(beta1, beta2, lnSize)
+
+    @staticmethod
+    def _column(day: str, hour: int) -> int:
+        return DAYS.index(day) * 24 + hour
+
+    def _base(self, sources: slice | np.ndarray) -> np.ndarray:
+        """
+        The travel and elevation part of the utility for the given source rows.
+        """
+        base = -self.beta1 * self.travel[sources] - self.beta2 * self.elevation[sources]
+        if self.exclude_self:
+            rows = np.arange(self.num_hubs)[sources]
+            base[np.arange(len(rows)), rows] = -np.inf
+        return base
+
+    def _log_denominators(self, sources: slice | np.ndarray) -> np.ndarray:
+        """
+        log-sum-exp over destinations for the given sources, (len(sources), 120).
+        exp(utility) factors into exp(base) * exp(lnSize * log_size), so every sum is one
+        matrix product, shifted by the row and column maxima to stay in range, and no
+        (sources, hubs, 120) utility array is ever built.
+        """
+        base = self._base(sources)
+        attraction = self.lnSize * self.log_size
+        row_peak = base.max(axis=1, keepdims=True)
+        col_peak = attraction.max(axis=0, keepdims=True)
+        return row_peak + col_peak + np.log(np.exp(base - row_peak) @ np.exp(attraction - col_peak))
+
+    def set_params(self, beta1: float, beta2: float, lnSize: float) -> None:
+        """
+        New utility weights; every denominator changes, so this is a full recompute.
+        """
+        self.beta1, self.beta2, self.lnSize = float(beta1), float(beta2), float(lnSize)
+        self.base = self._base(slice(None))
+        self.log_denominator = self._log_denominators(slice(None))
+
+    def _replace_term(self, dest: int, column: int, old_log_size: float) -> None:
+        # swap destination dest's term in the denominator of every source at column
+        lse = self.log_denominator[:, column]
+        old = np.exp(self.base[:, dest] + self.lnSize * old_log_size - lse)
+        new = np.exp(self.base[:, dest] + self.lnSize * self.log_size[dest, column] - lse)
+        stale = old > _CANCEL_SHARE
+        with np.errstate(divide="ignore"):
+            lse += np.log(1 - old + new)
+        if stale.any():
+            sources = np.flatnonzero(stale)
+            lse[sources] = self._log_denominators(sources)[:, column]
+
+    def set_size(self, hub: int, day: str, hour: int, size: float) -> None:
+        """
+        Change the people around hub on day at hour; updates one term of hubs denominators.
+        """
+        column = self._column(day, hour)
+        old = self.log_size[hub, column]
+        self.log_size[hub, column] = np.log(max(size, 1))
+        self._replace_term(hub, column, old)
+
+    def set_sizes(self, hub: int, sizes: np.ndarray) -> None:
+        """
+        Replace hub's whole (5, 24) size profile, i.e. one destination column.
+        """
+        new = np.log(np.maximum(np.asarray(sizes, dtype=float), 1)).reshape(-1)
+        old = self.log_size[hub].copy()
+        self.log_size[hub] = new
+        for column in np.flatnonzero(new != old):
+            self._replace_term(hub, column, old[column])
+
+    def set_travel_row(self, source: int, travel: np.ndarray) -> None:
+        """
+        New travel times from source; only source's denominators are recomputed.
+        """
+        self.travel[source] = travel
+        self._refresh_source(source)
+
+    def set_elevation_row(self, source: int, elevation: np.ndarray) -> None:
+        """
+        New elevation differences from source; only source's denominators are recomputed.
+        """
+        self.elevation[source] = elevation
+        self._refresh_source(source)
+
+    def _refresh_source(self, source: int) -> None:
+        rows = np.array([source])
+        self.base[source] = self._base(rows)[0]
+        self.log_denominator[source] = self._log_denominators(rows)[0]
+
+    def utility(self, source: int, dest: int, day: str, hour: int) -> float:
+        return float(self.base[source, dest] + self.lnSize * self.log_size[dest, self._column(day, hour)])
+
+    def probability(self, source: int, dest: int, day: str, hour: int) -> float:
+        """
+        Probability of riding from source to dest, equal to hourly_usage_and_probability.probability.
+        """
+        column = self._column(day, hour)
+        return float(np.exp(self.utility(source, dest, day, hour) - self.log_denominator[source, column]))
+
+    def probabilities(self, day: str, hour: int) -> np.ndarray:
+        """
+        (hubs, hubs) destination probabilities at day and hour, rows are sources.
+        """
+        column = self._column(day, hour)
+        util = self.base + self.lnSize * self.log_size[None, :, column]
+        return np.exp(util - self.log_denominator[:, column, None])
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        """
+        Copies of the cached state, for undoing a perturbation in a calibration loop with restore.
+        """
+        return {name: getattr(self, name).copy()
+                for name in ("travel", "elevation", "log_size", "base", "log_denominator")}
+
+    def restore(self, state: Dict[str, np.ndarray]) -> None:
+        for name, value in state.items():
+            getattr(self, name)[...] = value
+
+
+def middlebury_mnl(**kwargs) -> Tuple[IncrementalMNL, Dict[str, int]]:
+    """
+    An IncrementalMNL over the constants network, and constants.location_index.
+    """
+    import constants
+    from network_generator import size_array
+    mnl = IncrementalMNL(constants.travel_time, constants.elevation_matrix,
+                         size_array(constants.size_dictionary), **kwargs)
+    return mnl, constants.location_index
@@ -0,0 +1,111 @@
+from __future__ import annotations
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+import numpy as np
+
+"""
+Opt-in metrics for simulation_code.simulation and simulation_main.run_simulation.
+Pass a SimulationMetrics as the metrics keyword to either function; it accumulates
+over every simulated day it sees. Leaving metrics as None keeps the hot loops free
+of any bookkeeping.
+"""
+
+
+class SimulationMetrics:
+    """ Counters and timers collected while simulating
+
+    Hour-indexed arrays are summed over every simulated day.
+
+    Attributes
+    ----------
+    days: int - number of simulated days recorded
+    in_transit: (24,) int - trips on the road at the start of each hour
+    checkout_attempts: (24,) int - rental requests, successful or not
+    overflow_redirects: (24,) int - full-dock arrivals sent on to another hub
+    overflow_stranded: (24,) int - full-dock arrivals with no open hub, kept riding for an hour
+    redirect_search_lengths: list of int - hubs inspected by each overflow search
+    dock_seconds: (24,) float - time spent docking arrivals
+    rental_seconds: (24,) float - time spent processing rentals
+    stage_seconds: dict - time per run_simulation stage
+    """
+    def __init__(self) -> None:
+        self.days = 0
+        self.in_transit = np.zeros(24, dtype=int)
+        self.checkout_attempts = np.zeros(24, dtype=int)
+        self.overflow_redirects = np.zeros(24, dtype=int)
+        self.overflow_stranded = np.zeros(24, dtype=int)
+        self.redirect_search_lengths: List[int] = []
+        self.dock_seconds = np.zeros(24, dtype=float)
+        self.rental_seconds = np.zeros(24, dtype=float)
+        self.stage_seconds: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Add the wall-clock time spent inside the with-block to stage_seconds[name].
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + time.perf_counter() - start
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Returns:
+        every metric as a NumPy array, keyed by metric name; stage timings appear
+        as stage_seconds_<name>
+        """
+        arrays = {
+            "days": np.array(self.days),
+            "in_transit": self.in_transit.copy(),
+            "checkout_attempts": self.checkout_attempts.copy(),
+            "overflow_redirects": self.overflow_redirects.copy(),
+            "overflow_stranded": self.overflow_stranded.copy(),
+            "redirect_search_lengths": np.array(self.redirect_search_lengths, dtype=int),
+            "dock_seconds": self.dock_seconds.copy(),
+            "rental_seconds": self.rental_seconds.copy(),
+        }
+        for name, seconds in self.stage_seconds.items():
+            arrays[f"stage_seconds_{name}"] = np.array(seconds)
+        return arrays
+
+    def to_prometheus(self, prefix: str = "middbike") -> str:
+        """
+        Render the metrics in the Prometheus text exposition format. Hourly arrays
+        become one sample per hour with an hour label, stage timings carry a stage label.
+        """
+        lines: List[str] = []
+
+        def family(name: str, kind: str, help_text: str) -> str:
+            full = f"{prefix}_{name}"
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            return full
+
+        full = family("simulated_days_total", "counter", "Simulated days recorded.")
+        lines.append(f"{full} {self.days}")
+
+        hourly = (
+            ("in_transit_trips", self.in_transit, "Trips on the road at the start of the hour."),
+            ("checkout_attempts_total", self.checkout_attempts, "Rental requests."),
+            ("overflow_redirects_total", self.overflow_redirects, "Full-dock arrivals redirected."),
+            ("overflow_stranded_total", self.overflow_stranded, "Full-dock arrivals with no open hub."),
+            ("dock_seconds_total", self.dock_seconds, "Seconds spent docking arrivals."),
+            ("rental_seconds_total", self.rental_seconds, "Seconds spent processing rentals."),
+        )
+        for name, values, help_text in hourly:
+            full = family(name, "counter", help_text)
+            for hour, value in enumerate(values):
+                lines.append(f'{full}{{hour="{hour}"}} {value}')
+
+        searches = np.array(self.redirect_search_lengths, dtype=int)
+        full = family("redirect_search_length", "summary", "Hubs inspected per overflow search.")
+        lines.append(f"{full}_count {searches.size}")
+        lines.append(f"{full}_sum {int(searches.sum())}")
+
+        full = family("stage_seconds_total", "counter", "Seconds spent in each run_simulation stage.")
+        for name, seconds in self.stage_seconds.items():
+            lines.append(f'{full}{{stage="{name}"}} {seconds}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,190 @@
+from __future__ import annotations
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, TextIO, Tuple
+import simulation_main as sim
+from seeding import SeedStreams
+
+"""
+Command-line runner for headless batch runs. Results stream to CSV or JSONL as they
+finish; nothing here imports matplotlib.
+
+    python middbike.py simulate --stock 5 --capacity 10 --replications 100 --seed 1
+    python middbike.py sweep --stock 5 10 15 --capacity 10 20 30 --workers 4 --output sweep.csv
+    python middbike.py sweep --store scenarios.mbs --scenario weekday exam_week --output sweep.csv
+"""
+
+FIELDS = ("scenario", "day", "stock", "capacity", "replication", "replications", "seed",
+          "no_bike", "no_parking", "seconds")
+
+
+def load_scenario(path: str | None) -> Dict[int, Dict[str, Dict[int, int]]] | None:
+    """
+    Read hourly lambdas in the converted_population layout from a JSON file
+    ({hub: {day: {hour: lambda}}}); None means the built-in converted_population.
+    """
+    if path is None:
+        return None
+    with open(path) as f:
+        raw = json.load(f)
+    return {int(hub): {day: {int(hour): lam for hour, lam in hours.items()}
+                       for day, hours in days.items()}
+            for hub, days in raw.items()}
+
+
+def scenario_kwargs(scenario: str | None, store: str | None) -> Dict[str, object]:
+    """
+    run_simulation keyword arguments for a scenario: a name in the scenario store when
+    store is given, a JSON lambdas file otherwise.
+    """
+    if store is None:
+        return {"hourly_lambdas": load_scenario(scenario)}
+    from scenario_store import ScenarioStore
+    return ScenarioStore(store)[scenario].run_kwargs()
+
+
+class ResultWriter:
+    """ Streams result rows to CSV or JSONL, flushing after every row """
+    def __init__(self, stream: TextIO, fmt: str) -> None:
+        if fmt not in ("csv", "jsonl"):
+            raise ValueError("format must be csv or jsonl")
+        self._stream = stream
+        self._fmt = fmt
+        self._csv = None
+        if fmt == "csv":
+            self._csv = csv.DictWriter(stream, fieldnames=FIELDS)
+            self._csv.writeheader()
+
+    def write(self, row: Dict[str, object]) -> None:
+        if self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self._stream.write(json.dumps(row) + "\n")
+        self._stream.flush()
+
+
+def _run_point(task: Tuple[str, int, int, int, int | None, str | None, str | None, int | None, bool]
+               ) -> Dict[str, object]:
+    """
+    Simulate one (stock, capacity) point; module-level so worker processes can unpickle it.
+    A task with a replication index runs only that replication of seed, with the same
+    streams it gets inside a sweep.
+    """
+    day, stock, capacity, replications, seed, scenario, store, replication, vectorized = task
+    start = time.perf_counter()
+    no_bike, no_parking = sim.run_simulation(
+        capacity, stock, **scenario_kwargs(scenario, store), day=day,
+        replications=replications, seed=seed, first_replication=replication or 0, vectorized=vectorized)
+    return {
+        "scenario": scenario, "day": day, "stock": stock, "capacity": capacity, "replication": replication,
+        "replications": replications, "seed": seed, "no_bike": float(no_bike),
+        "no_parking": float(no_parking), "seconds": time.perf_counter() - start,
+    }
+
+
+def _map(tasks: List[tuple], workers: int) -> Iterator[Dict[str, object]]:
+    if workers <= 1:
+        for task in tasks:
+            yield _run_point(task)
+        return
+    from multiprocessing import Pool
+    with Pool(workers) as pool:
+        yield from pool.imap(_run_point, tasks)
+
+
+def _resolve_seed(seed: int | None) -> int:
+    """
+    The seed to record and run with; a fresh one when none was given.
+    """
+    return SeedStreams(seed).entropy
+
+
+def _scenarios(args: argparse.Namespace) -> List[str | None]:
+    if args.store is not None:
+        if not os.path.exists(args.store):
+            raise ValueError(f"scenario store {args.store} does not exist")
+        if not args.scenario:
+            from scenario_store import ScenarioStore
+            names = ScenarioStore(args.store).names()
+            if not names:
+                raise ValueError(f"scenario store {args.store} has no scenarios")
+            return names
+    return args.scenario or [None]
+
+
+def simulate(args: argparse.Namespace) -> Iterable[Dict[str, object]]:
+    """
+    One row per replication of a single stock/capacity configuration, for each scenario.
+    """
+    seed = _resolve_seed(args.seed)
+    tasks = [(args.day, args.stock, args.capacity, 1, seed, scenario, args.store, r, False)
+             for scenario in _scenarios(args) for r in range(args.replications)]
+    return _map(tasks, args.workers)
+
+
+def sweep(args: argparse.Namespace) -> Iterable[Dict[str, object]]:
+    """
+    One row per (scenario, stock, capacity) point, averaged over the replications. Every
+    point uses the same seed, so points are compared on common random numbers.
+    """
+    seed = _resolve_seed(args.seed)
+    tasks = [(args.day, stock, capacity, args.replications, seed, scenario, args.store, None, args.vectorized)
+             for scenario in _scenarios(args) for stock in args.stock for capacity in args.capacity]
+    return _map(tasks, args.workers)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="middbike", description="Headless middbike simulation runs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def common(p: argparse.ArgumentParser) -> None:
+        p.add_argument("--day", default="W", choices=["M", "T", "W", "R", "F"])
+        p.add_argument("--replications", type=int, default=100)
+        p.add_argument("--seed", type=int, default=None,
+                       help="root seed, recorded in every row; fresh when omitted")
+        p.add_argument("--workers", type=int, default=1, help="worker processes")
+        p.add_argument("--scenario", nargs="+",
+                       help="JSON lambdas files in the converted_population layout, or scenario names "
+                            "with --store (every scenario in the store when omitted)")
+        p.add_argument("--store", help="scenario store file (scenario_store.py)")
+        p.add_argument("--output", help="file to write, stdout when omitted")
+        p.add_argument("--format", choices=["csv", "jsonl"],
+                       help="output format, taken from the --output extension by default")
+
+    p = sub.add_parser("simulate", help="replications of one configuration, one row each")
+    p.add_argument("--stock", type=int, default=5, help="initial bikes per hub")
+    p.add_argument("--capacity", type=int, default=10, help="docks per hub")
+    common(p)
+    p.set_defaults(run=simulate)
+
+    p = sub.add_parser("sweep", help="grid of stock x capacity, one averaged row per point")
+    p.add_argument("--stock", type=int, nargs="+", default=[5, 10, 15, 20, 25])
+    p.add_argument("--capacity", type=int, nargs="+", default=[10, 20, 30, 40, 50])
+    p.add_argument("--vectorized", action="store_true",
+                   help="run each point's replications in lockstep (batch_simulation)")
+    common(p)
+    p.set_defaults(run=sweep)
+    return parser
+
+
+def main(argv: List[str] | None = None) -> None:
+    args = build_parser().parse_args(argv)
+    fmt = args.format or ("jsonl" if args.output and args.output.endswith((".jsonl", ".json")) else "csv")
+    # the tasks are built before the output is opened, so a bad --store leaves no file behind
+    rows = args.run(args)
+    stream = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        writer = ResultWriter(stream, fmt)
+        for row in rows:
+            writer.write(row)
+    finally:
+        if args.output:
+            stream.close()
+
+
+if __name__ == "__main__":
+    main()
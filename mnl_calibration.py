@@ -0,0 +1,254 @@
+from __future__ import annotations
+import argparse
+import csv
+from typing import Dict, Tuple
+import numpy as np
+from hourly_lambdas import DAYS
+
+"""
+Maximum likelihood fit of the hourly_usage_and_probability utility weights
+
+    utility(s, d, day, hour) = -beta1 * travel[s, d] - beta2 * elevation[s, d]
+                               + lnSize * log(max(size[d, day, hour], 1))
+
+to observed origin-destination trips. The log-likelihood only depends on the trips through
+    - the summed features of the chosen destinations, and
+    - how many trips start in each (origin, day, hour) choice situation,
+so the trips are read once and every iteration costs O(situations * hubs) however many
+millions of trips there are. Situations are evaluated in batches with a shifted
+log-sum-exp; the gradient and Hessian are analytic and Newton's method converges in a
+handful of iterations.
+
+    fit = fit_mnl(origins, destinations, days, hours, travel_time, elevation_matrix, sizes)
+    fit.beta1, fit.beta2, fit.lnSize
+"""
+
+PARAMS = ("beta1", "beta2", "lnSize")
+
+
+class MNLFit:
+    """ Result of fit_mnl
+
+    Attributes
+    ----------
+    beta1, beta2, lnSize: float - fitted utility weights
+    log_likelihood: float - at the fitted weights
+    std_errors: (3,) - from the inverse of the observed information, PARAMS order
+    iterations: int - Newton steps taken
+    converged: bool
+    trips: int - number of trips fitted
+    """
+    def __init__(self, params: np.ndarray, log_likelihood: float, std_errors: np.ndarray,
+                 iterations: int, converged: bool, trips: int) -> None:
+        self.beta1, self.beta2, self.lnSize = (float(p) for p in params)
+        self.log_likelihood = log_likelihood
+        self.std_errors = std_errors
+        self.iterations = iterations
+        self.converged = converged
+        self.trips = trips
+
+    def params(self) -> Dict[str, float]:
+        """
+        The weights as keyword arguments for IncrementalMNL or generate_network.
+        """
+        return {"beta1": self.beta1, "beta2": self.beta2, "lnSize": self.lnSize}
+
+    def __repr__(self) -> str:
+        return (f"MNLFit(beta1={self.beta1:.4f}, beta2={self.beta2:.4f}, lnSize={self.lnSize:.4f}, "
+                f"log_likelihood={self.log_likelihood:.2f}, trips={self.trips}, converged={self.converged})")
+
+
+def day_indices(days: np.ndarray) -> np.ndarray:
+    """
+    Day letters (DAYS) or day indices as an int array of indices into DAYS.
+    """
+    days = np.asarray(days)
+    if days.dtype.kind in "US":
+        lookup = {day: index for index, day in enumerate(DAYS)}
+        return np.array([lookup[day] for day in days.tolist()], dtype=np.intp)
+    return days.astype(np.intp)
+
+
+class _TripData:
+    """ The sufficient statistics of a set of trips """
+    def __init__(self, origins, destinations, days, hours, travel, elevation, log_size, exclude_self):
+        origins = np.asarray(origins, dtype=np.intp)
+        destinations = np.asarray(destinations, dtype=np.intp)
+        columns = day_indices(days) * 24 + np.asarray(hours, dtype=np.intp)
+        if exclude_self and np.any(origins == destinations):
+            raise ValueError("trips back to their origin are impossible with exclude_self")
+        self.travel, self.elevation, self.log_size = travel, elevation, log_size
+        self.exclude_self = exclude_self
+        self.trips = len(origins)
+        # summed features of the chosen destinations, in PARAMS order
+        self.chosen = np.array([-travel[origins, destinations].sum(),
+                                -elevation[origins, destinations].sum(),
+                                log_size[destinations, columns].sum()])
+        keys, self.counts = np.unique(origins * log_size.shape[1] + columns, return_counts=True)
+        self.origins, self.columns = np.divmod(keys, log_size.shape[1])
+
+    def evaluate(self, params: np.ndarray, batch: int) -> Tuple[float, np.ndarray, np.ndarray]:
+        """
+        returns:
+            log-likelihood, gradient (3,) and Hessian (3, 3) at params
+        """
+        log_likelihood = float(self.chosen @ params)
+        gradient = self.chosen.copy()
+        hessian = np.zeros((3, 3))
+        for start in range(0, len(self.counts), batch):
+            rows = slice(start, start + batch)
+            origins, columns, counts = self.origins[rows], self.columns[rows], self.counts[rows]
+            # features of every destination in each situation, (batch, hubs, 3)
+            features = np.stack([-self.travel[origins], -self.elevation[origins],
+                                 self.log_size[:, columns].T], axis=2)
+            util = features @ params
+            if self.exclude_self:
+                util[np.arange(len(origins)), origins] = -np.inf
+            peak = util.max(axis=1, keepdims=True)
+            weight = np.exp(util - peak)
+            total = weight.sum(axis=1, keepdims=True)
+            prob = weight / total
+            log_likelihood -= float(counts @ (peak + np.log(total))[:, 0])
+            mean = (prob[:, None, :] @ features)[:, 0]
+            # sum over situations of counts * E[x x^T], as one (batch * hubs, 3) product
+            weighted = (features * (counts[:, None] * prob)[:, :, None]).reshape(-1, 3)
+            gradient -= counts @ mean
+            hessian -= weighted.T @ features.reshape(-1, 3) - (mean * counts[:, None]).T @ mean
+        return log_likelihood, gradient, hessian
+
+
+def fit_mnl(
+    origins: np.ndarray,
+    destinations: np.ndarray,
+    days: np.ndarray,
+    hours: np.ndarray,
+    travel: np.ndarray,
+    elevation: np.ndarray,
+    sizes: np.ndarray,
+    *,
+    start: Tuple[float, float, float] = (0.25, 0.25, 0.75),
+    exclude_self: bool = False,
+    tol: float = 1e-8,
+    max_iter: int = 50,
+    batch: int = 4096,
+    ) -> MNLFit:
+    """
+    Fit beta1, beta2 and lnSize by Newton's method on the exact log-likelihood.
+    params:
+        origins, destinations: (trips,) hub indices of every trip
+        days: (trips,) day letters from DAYS or day indices
+        hours: (trips,) hour of the day each trip started
+        travel, elevation: (hubs, hubs) matrices as in constants
+        sizes: (hubs, 5, 24) people around each hub, e.g. network_generator.size_array(size_dictionary)
+    keyword args:
+        start: initial weights, the hand-picked hourly_usage_and_probability values by default
+        exclude_self: leave the origin out of the choice set, as generate_network does
+        tol: stop once the Newton step and gradient are this small
+        batch: choice situations evaluated per set of array operations, bounds memory
+            at batch * hubs * 3 floats
+    """
+    travel = np.asarray(travel, dtype=float)
+    elevation = np.asarray(elevation, dtype=float)
+    log_size = np.log(np.maximum(np.asarray(sizes, dtype=float), 1)).reshape(travel.shape[0], -1)
+    data = _TripData(origins, destinations, days, hours, travel, elevation, log_size, exclude_self)
+    if data.trips == 0:
+        raise ValueError("no trips to fit")
+
+    params = np.array(start, dtype=float)
+    log_likelihood, gradient, hessian = data.evaluate(params, batch)
+    converged = False
+    iteration = 0
+    for iteration in range(1, max_iter + 1):
+        try:
+            step = np.linalg.solve(hessian, -gradient)
+        except np.linalg.LinAlgError:
+            step = gradient / data.trips  # flat direction: fall back to a gradient step
+        # halve the step until the likelihood does not drop
+        scale = 1.0
+        while True:
+            candidate = params + scale * step
+            result = data.evaluate(candidate, batch)
+            if result[0] >= log_likelihood - 1e-12 * abs(log_likelihood) or scale < 1e-6:
+                break
+            scale /= 2
+        params = candidate
+        log_likelihood, gradient, hessian = result
+        if np.abs(scale * step).max() < tol or np.abs(gradient).max() < tol * data.trips:
+            converged = True
+            break
+
+    try:
+        std_errors = np.sqrt(np.diag(np.linalg.inv(-hessian)))
+    except np.linalg.LinAlgError:
+        std_errors = np.full(3, np.nan)
+    return MNLFit(params, log_likelihood, std_errors, iteration, converged, data.trips)
+
+
+def sample_trips(
+    count: int,
+    travel: np.ndarray,
+    elevation: np.ndarray,
+    sizes: np.ndarray,
+    *,
+    beta1: float = 0.25,
+    beta2: float = 0.25,
+    lnSize: float = 0.75,
+    exclude_self: bool = False,
+    rng: np.random.Generator | None = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    count synthetic trips from the model itself, origins, days and hours uniform; for
+    checking that fit_mnl recovers known weights.
+    returns:
+        origins, destinations, days (indices), hours
+    """
+    from incremental_mnl import IncrementalMNL
+    if rng is None:
+        rng = np.random.default_rng()
+    mnl = IncrementalMNL(travel, elevation, sizes, beta1=beta1, beta2=beta2, lnSize=lnSize,
+                         exclude_self=exclude_self)
+    origins = rng.integers(mnl.num_hubs, size=count)
+    days = rng.integers(len(DAYS), size=count)
+    hours = rng.integers(24, size=count)
+    destinations = np.empty(count, dtype=np.intp)
+    columns = days * 24 + hours
+    for column in np.unique(columns):
+        picked = np.flatnonzero(columns == column)
+        cdf = mnl.probabilities(DAYS[column // 24], column % 24).cumsum(axis=1)
+        u = rng.random(len(picked)) * cdf[origins[picked], -1]
+        destinations[picked] = (cdf[origins[picked]] <= u[:, None]).sum(axis=1)
+    return origins, np.minimum(destinations, mnl.num_hubs - 1), days, hours
+
+
+def read_trips(path: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Trips from a CSV file with origin, destination, day and hour columns (hub indices, a
+    DAYS letter and an hour of the day).
+    """
+    with open(path, newline="") as f:
+        rows = [(int(r["origin"]), int(r["destination"]), r["day"], int(r["hour"])) for r in csv.DictReader(f)]
+    origins, destinations, days, hours = zip(*rows) if rows else ((), (), (), ())
+    return np.array(origins), np.array(destinations), day_indices(np.array(days, dtype=str)), np.array(hours)
+
+
+if __name__ == "__main__":
+    import constants
+    from network_generator import size_array
+
+    parser = argparse.ArgumentParser(description="Fit beta1, beta2 and lnSize to trip records.")
+    parser.add_argument("trips", nargs="?", help="CSV with origin, destination, day, hour columns; "
+                        "synthetic trips from the hand-picked weights when omitted")
+    parser.add_argument("--synthetic", type=int, default=100000, help="number of synthetic trips")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    sizes = size_array(constants.size_dictionary)
+    if args.trips:
+        trips = read_trips(args.trips)
+    else:
+        trips = sample_trips(args.synthetic, constants.travel_time, constants.elevation_matrix, sizes,
+                             rng=np.random.default_rng(args.seed))
+    fit = fit_mnl(*trips, constants.travel_time, constants.elevation_matrix, sizes)
+    print(fit)
+    for name, value, error in zip(PARAMS, (fit.beta1, fit.beta2, fit.lnSize), fit.std_errors):
+        print(f"{name} = {value:.5f} +/- {error:.5f}")
@@ -0,0 +1,196 @@
+from __future__ import annotations
+from typing import Dict, Iterator, List
+import numpy as np
+import constants
+import new_probability as nwp
+import simulation_main as sim
+import sparse_probability as sparse
+from hourly_lambdas import DAYS, lambda_array, lambdas_from_array
+
+"""
+Synthetic N-hub networks for stress-testing the simulation beyond the 10 Middlebury hubs.
+Hubs are scattered on a plane at Middlebury's hub density, and every tensor the pipeline
+reads (travel times, elevation, sizes, lambdas, destination probability blocks) is derived
+from that one layout, so the pieces stay consistent with each other.
+
+    net = generate_network(1000, seed=1)
+    run_simulation(10, 5, hourly_lambdas=net.lambdas, travel=net.travel_time,
+                   probabilities=net.probabilities(), replications=1)
+"""
+
+# side of the square holding the 10 real hubs in km, and riding speed in km per minute
+MIDDLEBURY_SIDE_KM = 2.5
+SPEED_KM_PER_MIN = 0.25
+
+
+class Network:
+    """ A bikeshare network in the layouts the simulation pipeline reads
+
+    Attributes
+    ----------
+    names: list of str - hub names, index i is hub i
+    travel_time: (n, n) int - minutes from source to destination
+    elevation_matrix: (n, n) int - elevation gained from source to destination
+    sizes: (n, 5, 24) float - people around each hub per day (DAYS order) and hour
+    lambda_array: (n, 5, 24) int - rental requests per hub, day and hour
+    blocks: (5, n, n) float - destination probabilities per block of the clock, in
+        new_probability.HOUR_TO_BLOCK order, or None for a network built with top_k
+    destinations: sparse_probability.DestinationCSR or None - top-k destination probabilities
+    """
+    def __init__(self,
+                 names: List[str],
+                 travel_time: np.ndarray,
+                 elevation_matrix: np.ndarray,
+                 sizes: np.ndarray,
+                 lambda_array: np.ndarray,
+                 blocks: np.ndarray | None,
+                 destinations: sparse.DestinationCSR | None = None
+                ) -> None:
+        self.names = names
+        self.travel_time = travel_time
+        self.elevation_matrix = elevation_matrix
+        self.sizes = sizes
+        self.lambda_array = lambda_array
+        self.blocks = blocks
+        self.destinations = destinations
+        self._lambdas: Dict[int, Dict[str, Dict[int, int]]] | None = None
+
+    @property
+    def num_hubs(self) -> int:
+        return self.travel_time.shape[0]
+
+    @property
+    def lambdas(self) -> Dict[int, Dict[str, Dict[int, int]]]:
+        """
+        lambda_array in the converted_population layout, built on first use.
+        """
+        if self._lambdas is None:
+            self._lambdas = lambdas_from_array(self.lambda_array)
+        return self._lambdas
+
+    def size_dictionary(self) -> Dict[str, Dict[str, Dict[str, int]]]:
+        """
+        sizes in the constants.size_dictionary layout (string keys throughout).
+        """
+        return {
+            str(hub): {day: {str(hour): int(self.sizes[hub, d, hour]) for hour in range(24)}
+                       for d, day in enumerate(DAYS)}
+            for hub in range(self.num_hubs)
+        }
+
+    def probabilities(self) -> Dict[int, Dict[str, np.ndarray]] | sparse.DestinationCSR:
+        """
+        Destination probabilities in the build_probabilities layout, or the sparse
+        destinations when the network has no dense blocks.
+        """
+        if self.blocks is None:
+            return self.destinations
+        return sim.build_probabilities(self.num_hubs, self.blocks)
+
+
+def size_array(size_dictionary: Dict[str, Dict[str, Dict[str, int]]]) -> np.ndarray:
+    """
+    Convert a size_dictionary (constants layout) to an (n, 5, 24) array in DAYS order.
+    """
+    return np.array([[[size_dictionary[str(hub)][day].get(str(hour), 0) for hour in range(24)]
+                      for day in DAYS] for hub in range(len(size_dictionary))], dtype=float)
+
+
+def middlebury_network() -> Network:
+    """
+    The real 10-hub network from constants and converted_population as a Network.
+    """
+    from converted_population import converted_population
+
+    names = sorted(constants.location_index, key=constants.location_index.get)
+    return Network(names, constants.travel_time, constants.elevation_matrix,
+                   size_array(constants.size_dictionary), lambda_array(converted_population).astype(int),
+                   np.array(nwp.BLOCKS, dtype=float))
+
+
+def _row_chunks(n: int, chunk: int) -> Iterator[slice]:
+    for start in range(0, n, chunk):
+        yield slice(start, min(start + chunk, n))
+
+
+def generate_network(
+    num_hubs: int,
+    *,
+    seed: int | None = None,
+    prob: float = 0.1,
+    beta1: float = 0.25,
+    beta2: float = 0.25,
+    lnSize: float = 0.75,
+    top_k: int | None = None,
+    chunk: int = 512,
+    ) -> Network:
+    """
+    Synthesize a num_hubs network from a random geometric layout.
+    params:
+        num_hubs: number of hubs
+        seed: seed for the layout, sizes and lambdas
+        prob: share of the people around a hub that request a bike, as in hourly_lambdas
+        beta1, beta2, lnSize: weights of the hourly_usage_and_probability utility
+            (travel time, elevation, log size) used for the destination probabilities
+        top_k: keep only the top_k likeliest destinations per source and block, as a
+            sparse_probability.DestinationCSR, and never hold a dense block matrix
+        chunk: rows processed at once while building hubs x hubs matrices, bounds peak memory
+    returns:
+        network: Network whose hub i follows the daily population profile of Middlebury hub i % 10.
+        Travel time is riding time plus one minute per 5 units of climb; elevation is the climb
+        between hub heights; lambdas are Poisson draws around size / 8 * prob; each block matrix
+        is the multinomial logit over destinations at that block's average sizes, with the
+        night block left at zero like constants.ninepm_to_sevenam.
+    """
+    if num_hubs < 2:
+        raise ValueError("num_hubs must be at least 2")
+    rng = np.random.default_rng(seed)
+
+    # layout at Middlebury density: the square grows with sqrt(num_hubs)
+    side = MIDDLEBURY_SIDE_KM * np.sqrt(num_hubs / 10)
+    xy = rng.uniform(0.0, side, size=(num_hubs, 2))
+    # heights rise gently across the plane with local noise, in elevation_matrix units
+    height = 10.0 * xy[:, 1] / MIDDLEBURY_SIDE_KM + rng.normal(0.0, 4.0, num_hubs)
+
+    travel = np.empty((num_hubs, num_hubs), dtype=np.int32)
+    elevation = np.empty((num_hubs, num_hubs), dtype=np.int16)
+    for rows in _row_chunks(num_hubs, chunk):
+        dist = np.hypot(xy[rows, None, 0] - xy[None, :, 0], xy[rows, None, 1] - xy[None, :, 1])
+        climb = np.clip(np.rint(height[None, :] - height[rows, None]), 0, None)
+        elevation[rows] = climb
+        travel[rows] = np.ceil(dist / SPEED_KM_PER_MIN + climb / 5.0) + 1
+    np.fill_diagonal(travel, 0)
+    np.fill_diagonal(elevation, 0)
+
+    # population: Middlebury profile of hub i % 10 times a lognormal hub scale
+    template = size_array(constants.size_dictionary)
+    scale = rng.lognormal(0.0, 0.5, num_hubs)
+    sizes = np.rint(template[np.arange(num_hubs) % template.shape[0]] * scale[:, None, None])
+    lambdas = rng.poisson(sizes / 8 * prob).astype(int)
+
+    # multinomial logit per block, at the block's mean size over the week
+    if top_k is None:
+        blocks = np.zeros((len(nwp.BLOCKS), num_hubs, num_hubs), dtype=np.float32)
+    else:
+        k = min(top_k, num_hubs)
+        top_indices = np.zeros((len(nwp.BLOCKS), num_hubs, k), dtype=np.int32)
+        top_values = np.zeros((len(nwp.BLOCKS), num_hubs, k), dtype=float)
+    for block in range(1, len(nwp.BLOCKS)):
+        hours = np.flatnonzero(nwp.HOUR_TO_BLOCK == block)
+        log_size = np.log(np.maximum(sizes[:, :, hours].mean(axis=(1, 2)), 1))
+        for rows in _row_chunks(num_hubs, chunk):
+            util = -beta1 * travel[rows] - beta2 * elevation[rows] + lnSize * log_size[None, :]
+            util[np.arange(rows.stop - rows.start), np.arange(rows.start, rows.stop)] = -np.inf
+            util -= util.max(axis=1, keepdims=True)
+            weight = np.exp(util)
+            weight /= weight.sum(axis=1, keepdims=True)
+            if top_k is None:
+                blocks[block, rows] = weight
+            else:
+                top_indices[block, rows], top_values[block, rows] = sparse.top_k_rows(weight, k)
+
+    names = [f"hub_{hub}" for hub in range(num_hubs)]
+    if top_k is None:
+        return Network(names, travel, elevation, sizes, lambdas, blocks)
+    destinations = sparse.from_top_k(top_indices, top_values, nwp.HOUR_TO_BLOCK)
+    return Network(names, travel, elevation, sizes, lambdas, None, destinations)
@@ -1,16 +1,23 @@
 import constants as constants
 import numpy as np
 
-def calculate_probability(time, source, destination):
-    prob = 0
-    if 21 <= time or time < 7:
-        prob = constants.ninepm_to_sevenam[source][destination]
-    if 7 <= time < 8:
-        prob = constants.sevenam_to_eightam[source][destination]
-    if 8 <= time < 12:
-        prob = constants.eightam_to_twelvepm[source][destination]
-    if 12 <= time < 16:
-        prob = constants.twelvepm_to_fourpm[source][destination]
-    if 16 <= time < 21:
-        prob = constants.fourpm_to_ninepm[source][destination]
-    return prob
\ No newline at end of file
+#destination probability matrices, one per block of the 24 hour clock,
+#in the order of the block ids used by HOUR_TO_BLOCK
+BLOCKS = (
+    constants.ninepm_to_sevenam,
+    constants.sevenam_to_eightam,
+    constants.eightam_to_twelvepm,
+    constants.twelvepm_to_fourpm,
+    constants.fourpm_to_ninepm,
+)
+
+#block id of each hour of the day: 21-7 -> 0, 7-8 -> 1, 8-12 -> 2, 12-16 -> 3, 16-21 -> 4
+HOUR_TO_BLOCK = np.array([0] * 7 + [1] + [2] * 4 + [3] * 4 + [4] * 5 + [0] * 3)
+
+def calculate_probability(time, source, destination, blocks=BLOCKS):
+    """
+    Probability of riding from source to destination at hour time. blocks defaults
+    to the Middlebury matrices in constants; any sequence of five nxn matrices in
+    HOUR_TO_BLOCK order (e.g. from network_generator) can be passed instead.
+    """
+    return blocks[HOUR_TO_BLOCK[time]][source][destination]
@@ -1,14 +1,12 @@
+from __future__ import annotations
 import numpy as np
 from numpy.typing import NDArray
-from typing import Dict, Optional, List, Tuple
-import matplotlib.pyplot as plt
-from hourly_lambdas import hourly_lambdas
-from converted_population import converted_population
+from typing import Dict, Iterator, Mapping, Optional, List, Sequence, Tuple
 
 def nhp(
-    raw_hourly_lambdas: Dict[int, int],
+    raw_hourly_lambdas: Dict[int, float] | Sequence[float],
     *,
-    seed: Optional[int] = None
+    seed: Optional[int | np.random.Generator] = None
 ) -> np.ndarray:
     """
     Simulate one 24-hour day of requests as a non-homogeneous Poisson
@@ -16,8 +14,10 @@ def nhp(
 
     Parameters
     ----------
-    hourly_lambdas : Sequence[int] (length = 24) - Expected events in each hour (0-23)
-    seed : int or None, optional - Seed for NumPy's random generator
+    hourly_lambdas : Dict[int, float] or Sequence[float] (length = 24) - Expected events in
+        each hour (0-23); fractional rates, e.g. from demand_estimator, are kept as is
+    seed : int, Generator or None, optional - Seed for NumPy's random generator, or a
+        Generator to draw from directly
 
     Returns
     -------
@@ -25,15 +25,13 @@ def nhp(
     """
 
     # validate hourly_lambdas
-    hourly_lambdas = list(raw_hourly_lambdas.values())
-    print(hourly_lambdas)
-    if len(hourly_lambdas) != 24:
+    if isinstance(raw_hourly_lambdas, dict):
+        raw_hourly_lambdas = list(raw_hourly_lambdas.values())
+    lam = np.asarray(raw_hourly_lambdas, dtype=float)
+    if lam.shape != (24,):
         raise ValueError("hourly_lambdas must contain exactly 24 values")
-
-    # validate integer property
-    lam = np.asarray(hourly_lambdas, dtype=int)
     if np.any(lam < 0):
-        raise ValueError("hourly_lambdas must all be non-negative integers.")
+        raise ValueError("hourly_lambdas must all be non-negative.")
 
     lam_max = lam.max()
     if lam_max == 0:
@@ -45,7 +43,7 @@ def nhp(
     events = []
 
     # Piece‑wise constant λ(t)
-    def lam_t(time: float) -> int:
+    def lam_t(time: float) -> float:
         idx = min(int(time), 23)              # clamp 23.999… to 23
         return lam[idx]
 
@@ -73,7 +71,155 @@ def bin_events_by_hour(event_times: List[float], T: int) -> NDArray[np.int_]:
     return hourly_bins
 
 
+class Intensity:
+    """ Piecewise-linear rate lambda(t) over a day, in events per hour, t in hours
+
+    Segment i runs from knots[i] to knots[i + 1] with the rate going linearly from start[i]
+    to end[i]; start == end gives a piecewise-constant rate. Use the constructors:
+        Intensity.per_bin(counts) - expected events in equal bins: 24 for hourly lambdas,
+            1440 for a per-minute profile (e.g. class-change peaks at :50)
+        Intensity.piecewise_linear(times, rates) - rate given at times, linear in between
+    """
+    def __init__(self, knots: np.ndarray, start: np.ndarray, end: np.ndarray) -> None:
+        self.knots = np.asarray(knots, dtype=float)
+        self.start = np.asarray(start, dtype=float)
+        self.end = np.asarray(end, dtype=float)
+        if np.any(np.diff(self.knots) <= 0):
+            raise ValueError("knots must be strictly increasing")
+        if np.any(self.start < 0) or np.any(self.end < 0):
+            raise ValueError("intensity must be non-negative")
+        widths = np.diff(self.knots)
+        # cumulative intensity at every knot
+        self.cumulative = np.concatenate(([0.0], np.cumsum((self.start + self.end) / 2 * widths)))
+
+    @classmethod
+    def per_bin(cls, counts: Sequence[float], horizon: float = 24.0) -> Intensity:
+        counts = np.asarray(counts, dtype=float)
+        width = horizon / len(counts)
+        rate = counts / width
+        return cls(np.linspace(0.0, horizon, len(counts) + 1), rate, rate)
+
+    @classmethod
+    def piecewise_linear(cls, times: Sequence[float], rates: Sequence[float]) -> Intensity:
+        rates = np.asarray(rates, dtype=float)
+        return cls(times, rates[:-1], rates[1:])
+
+    @property
+    def total(self) -> float:
+        """
+        Expected number of events over the whole day.
+        """
+        return float(self.cumulative[-1])
+
+    def invert(self, targets: np.ndarray) -> np.ndarray:
+        """
+        Times t with cumulative intensity Lambda(t) = targets, for targets in [0, total].
+        """
+        segment = np.clip(np.searchsorted(self.cumulative, targets, side="right") - 1, 0, len(self.start) - 1)
+        remaining = targets - self.cumulative[segment]
+        a = self.start[segment]
+        slope = (self.end[segment] - a) / np.diff(self.knots)[segment]
+        # a * s + slope * s^2 / 2 = remaining, in the form that is stable for slope near 0
+        root = np.sqrt(np.maximum(a * a + 2 * slope * remaining, 0.0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = np.where(a + root > 0, 2 * remaining / (a + root), 0.0)
+        return np.minimum(self.knots[segment] + step, self.knots[segment + 1])
+
+    def hourly_means(self, hours: int = 24) -> np.ndarray:
+        """
+        Expected events in each hour, e.g. to feed a minute profile to the hourly engine.
+        """
+        return np.diff(self.cumulative_at(np.arange(hours + 1, dtype=float)))
+
+    def cumulative_at(self, t: np.ndarray) -> np.ndarray:
+        """
+        Cumulative intensity Lambda(t), the expected number of events before t.
+        """
+        t = np.clip(t, self.knots[0], self.knots[-1])
+        segment = np.clip(np.searchsorted(self.knots, t, side="right") - 1, 0, len(self.start) - 1)
+        s = t - self.knots[segment]
+        slope = (self.end[segment] - self.start[segment]) / np.diff(self.knots)[segment]
+        return self.cumulative[segment] + self.start[segment] * s + slope * s * s / 2
+
+
+def nhp_inversion(
+    intensity: Intensity | Sequence[float],
+    *,
+    seed: Optional[int | np.random.Generator] = None
+) -> np.ndarray:
+    """
+    Simulate one day of requests as an NHPP by time transformation: the number of events is
+    Poisson(total intensity) and their times are uniform order statistics of the cumulative
+    intensity mapped back through its inverse. Every draw becomes an event, so the cost is
+    O(events) however peaked the intensity is, where nhp's thinning proposes lam_max * 24
+    candidates.
+
+    Parameters
+    ----------
+    intensity : Intensity, or expected events per equal bin (24 hourly lambdas, 1440 per-minute
+        values, ...) as for Intensity.per_bin
+    seed : int, Generator or None, optional - as for nhp
+
+    Returns
+    -------
+    Sorted array of event times (floats) in fractional hours between 0 and 24
+    """
+    if not isinstance(intensity, Intensity):
+        intensity = Intensity.per_bin(intensity)
+    rng = np.random.default_rng(seed)
+    count = rng.poisson(intensity.total)
+    if count == 0:
+        return np.empty(0, dtype=float)
+    # sorted uniforms without a sort: normalized partial sums of count + 1 exponentials
+    gaps = rng.exponential(size=count + 1)
+    uniforms = np.cumsum(gaps[:-1]) / gaps.sum()
+    return intensity.invert(uniforms * intensity.total)
+
+
+def times_from_counts(hourly_counts: NDArray[np.int_], rng: np.random.Generator) -> np.ndarray:
+    """
+    Event times matching given hourly counts. With a rate that is constant within each
+    hour, the events of an hour are uniform over it once their number is known, so
+    bin_events_by_hour(times_from_counts(c, rng), 24) == c and the times have the same
+    distribution as nhp's.
+    returns:
+        sorted event times in fractional hours
+    """
+    hours = np.repeat(np.arange(len(hourly_counts)), hourly_counts)
+    return np.sort(hours + rng.random(len(hours)))
+
+
+class LazyTimestamps(Mapping):
+    """ hub -> event times for a (hubs, 24) array of hourly counts, drawn on first access
+
+    Each hub draws from its own child of the seed sequence, so the times do not depend on
+    which hubs are asked for or in what order, and nothing is drawn if nobody asks.
+    """
+    def __init__(self, counts: np.ndarray, rng: np.random.Generator) -> None:
+        self._counts = counts
+        self._seed_seq = rng.spawn(1)[0].bit_generator.seed_seq
+        self._cache: Dict[int, np.ndarray] = {}
+
+    def __getitem__(self, hub: int) -> np.ndarray:
+        if hub not in self._cache:
+            if not 0 <= hub < len(self._counts):
+                raise KeyError(hub)
+            seq = self._seed_seq
+            child = np.random.SeedSequence(seq.entropy, spawn_key=seq.spawn_key + (hub,), pool_size=seq.pool_size)
+            self._cache[hub] = times_from_counts(self._counts[hub], np.random.default_rng(child))
+        return self._cache[hub]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self._counts)))
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+
 if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+    from converted_population import converted_population
+
     # Generate events using NHPP
     dist = nhp(converted_population[2]["W"])
     hourly_counts = bin_events_by_hour(dist, 24)
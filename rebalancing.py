@@ -0,0 +1,179 @@
+from __future__ import annotations
+import argparse
+import csv
+import sys
+from typing import List, Tuple
+import numpy as np
+from simulation_code import travel_matrix
+
+"""
+Truck rebalancing plans from projected per-hub surpluses and deficits. Moving a bike from
+hub a to hub b costs the shortest driving time between them, so the plan is a
+transportation problem between surplus and deficit hubs. It is solved exactly by
+successive shortest paths. Each shortest path search is a Bellman-Ford pass over the
+dense (surplus x deficit) cost block, so each relaxation is one NumPy min over a matrix.
+
+The all-pairs shortest times are computed once per network (Floyd-Warshall on the travel
+matrix; np.inf marks a missing road), so re-planning every simulated hour only pays for
+the transportation problem.
+
+    planner = RebalancingPlanner(travel_time)
+    moves = planner.plan(imbalance)   # imbalance > 0: surplus bikes, < 0: bikes needed
+"""
+
+FIELDS = ("origin", "destination", "bikes", "minutes")
+
+# volumes below this count as zero
+_EPS = 1e-9
+
+
+def shortest_times(travel: np.ndarray) -> np.ndarray:
+    """
+    All-pairs shortest travel times (Floyd-Warshall), np.inf where no route exists.
+    params:
+        travel: (hubs, hubs) minutes, np.inf for no direct road; a digraph from
+            build_complete_digraph is read with travel_matrix
+    """
+    times = np.array(travel_matrix(travel), dtype=float)
+    np.fill_diagonal(times, 0.0)
+    for via in range(times.shape[0]):
+        np.minimum(times, times[:, via, None] + times[None, via, :], out=times)
+    return times
+
+
+class RebalancingPlanner:
+    """ Min-cost truck moves between surplus and deficit hubs on one network
+
+    Attributes
+    ----------
+    times: (hubs, hubs) float - shortest driving time between every pair of hubs
+    """
+    def __init__(self, travel: np.ndarray) -> None:
+        self.times = shortest_times(travel)
+
+    def plan(self, imbalance: np.ndarray) -> List[Tuple[int, int, float, float]]:
+        """
+        Moves that bring every hub as close to balance as the bikes allow at the least total
+        bike-minutes. When surpluses and deficits do not add up, the smaller side is moved
+        in full.
+        params:
+            imbalance: (hubs,) projected bikes over (> 0) or under (< 0) what the hub needs
+                for the window, e.g. window_imbalance
+        returns:
+            (origin, destination, bikes, minutes per bike) moves, largest first
+        """
+        flow, sources, sinks = self._solve(np.asarray(imbalance, dtype=float))
+        rows, cols = np.nonzero(flow > _EPS)
+        order = np.argsort(-flow[rows, cols], kind="stable")
+        rows, cols = rows[order], cols[order]
+        return [(int(sources[i]), int(sinks[j]), float(flow[i, j]), float(self.times[sources[i], sinks[j]]))
+                for i, j in zip(rows.tolist(), cols.tolist())]
+
+    def flow_matrix(self, imbalance: np.ndarray) -> np.ndarray:
+        """
+        The plan as a dense (hubs, hubs) matrix of bikes moved from origin to destination.
+        """
+        flow, sources, sinks = self._solve(np.asarray(imbalance, dtype=float))
+        matrix = np.zeros(self.times.shape)
+        matrix[np.ix_(sources, sinks)] = flow
+        return matrix
+
+    def cost(self, imbalance: np.ndarray) -> float:
+        """
+        Total bike-minutes of the plan.
+        """
+        return sum(bikes * minutes for _, _, bikes, minutes in self.plan(imbalance))
+
+    def _solve(self, imbalance: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        sources = np.flatnonzero(imbalance > _EPS)
+        sinks = np.flatnonzero(imbalance < -_EPS)
+        cost = self.times[np.ix_(sources, sinks)]
+        flow = np.zeros(cost.shape)
+        supply = imbalance[sources].copy()
+        demand = -imbalance[sinks]
+        num_sources, num_sinks = cost.shape
+
+        while supply.sum() > _EPS and demand.sum() > _EPS:
+            # Bellman-Ford over the residual graph: sources with bikes left are the roots,
+            # source -> sink arcs are always open (np.inf cost where unreachable), and
+            # sink -> source arcs undo the few moves already planned. Predecessors only
+            # change on a strict improvement, so zero-cost cycles never enter the path tree
+            moved_from, moved_to = np.nonzero(flow > _EPS)
+            undo_cost = -cost[moved_from, moved_to]
+            dist_source = np.where(supply > _EPS, 0.0, np.inf)
+            back_source = np.full(num_sources, -1)
+            dist_sink = np.full(num_sinks, np.inf)
+            back_sink = np.full(num_sinks, -1)
+            for _ in range(num_sources + 1):
+                via = dist_source[:, None] + cost
+                best = via.argmin(axis=0)
+                candidate = via[best, np.arange(num_sinks)]
+                better = candidate < dist_sink - _EPS
+                dist_sink[better] = candidate[better]
+                back_sink[better] = best[better]
+                candidate = dist_sink[moved_to] + undo_cost
+                improved = np.full(num_sources, np.inf)
+                np.minimum.at(improved, moved_from, candidate)
+                better = improved < dist_source - _EPS
+                if not better.any():
+                    break
+                dist_source[better] = improved[better]
+                # the move that gave each improved source its new distance
+                hit = better[moved_from] & (candidate == improved[moved_from])
+                back_source[moved_from[hit]] = moved_to[hit]
+
+            open_sinks = np.where(demand > _EPS, dist_sink, np.inf)
+            sink = int(open_sinks.argmin())
+            if not np.isfinite(open_sinks[sink]):
+                break  # the remaining deficits cannot be reached from any surplus
+
+            # walk the path back to its root, then push its bottleneck along it
+            path = []
+            j = sink
+            while True:
+                i = int(back_sink[j])
+                path.append((i, j))
+                if back_source[i] < 0:
+                    break
+                j = int(back_source[i])
+            amount = min(supply[i], demand[sink])
+            for a, (i, j) in enumerate(path[:-1]):
+                amount = min(amount, flow[i, path[a + 1][1]])
+            for a, (i, j) in enumerate(path):
+                flow[i, j] += amount
+                if a + 1 < len(path):
+                    flow[i, path[a + 1][1]] -= amount
+            supply[path[-1][0]] -= amount
+            demand[sink] -= amount
+        return flow, sources, sinks
+
+
+def window_imbalance(net: np.ndarray, day: int, start: int, stop: int) -> np.ndarray:
+    """
+    (hubs,) surplus of each hub over hours start..stop-1 of day, from a flow_report net
+    array: bikes expected to pile up (> 0) or to be missing (< 0).
+    """
+    return np.asarray(net)[:, day, start:stop].sum(axis=1)
+
+
+if __name__ == "__main__":
+    from constants import location_index, travel_time
+    from converted_population import converted_population
+    from flow_report import expected_flows
+    from hourly_lambdas import DAYS
+    from simulation_main import build_probabilities
+
+    parser = argparse.ArgumentParser(description="Truck moves that offset the expected imbalance of a time window.")
+    parser.add_argument("--day", default="W", choices=DAYS)
+    parser.add_argument("--start", type=int, default=7, help="first hour of the window")
+    parser.add_argument("--stop", type=int, default=10, help="hour after the window")
+    args = parser.parse_args()
+
+    names = sorted(location_index, key=location_index.get)
+    report = expected_flows(travel_time, converted_population, build_probabilities(len(names)), names)
+    imbalance = window_imbalance(report.net, DAYS.index(args.day), args.start, args.stop)
+    writer = csv.DictWriter(sys.stdout, fieldnames=FIELDS)
+    writer.writeheader()
+    for origin, destination, bikes, minutes in RebalancingPlanner(travel_time).plan(imbalance):
+        writer.writerow({"origin": names[origin], "destination": names[destination],
+                         "bikes": round(bikes, 2), "minutes": minutes})
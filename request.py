@@ -1,59 +1,33 @@
 class Request:
     """ A single rental request
 
+    Attributes are stored in __slots__ rather than a per-instance __dict__,
+    so a trip record costs a handful of pointers. simulation() only builds
+    these when the caller asks for the trip log.
+
     Attributes
     ----------
     origin: int
     dest: int
-    travel_time: int
+    minutes_left: int
     success: bool
     """
+    __slots__ = ("origin", "dest", "minutes_left", "success")
+
     def __init__(self,
                  origin: int = -1,
                  dest: int = -1,
                  minutes_left: int = 0,
                  success: bool = False
                 ) -> None:
-        self._origin = origin
-        self._dest = dest
-        self._minutes_left = minutes_left
-        self._success = success
-    
-    @property
-    def origin(self) -> int:
-        return self._origin
-    
-    @origin.setter
-    def origin(self, value: int) -> None:
-        self._origin = value
+        self.origin = origin
+        self.dest = dest
+        self.minutes_left = minutes_left
+        self.success = success
 
-    @property
-    def dest(self) -> int:
-        return self._dest
-    
-    @dest.setter
-    def dest(self, value: int) -> None:
-        self._dest = value
-    
-    @property
-    def minutes_left(self):
-        return self._minutes_left
-    
-    @minutes_left.setter
-    def minutes_left(self, value: int) -> None:
-        self._minutes_left = value
-    
-    @property
-    def success(self) -> bool:
-        return self._success
-    
-    @success.setter
-    def success(self, value: bool) -> None:
-        self._success = value
-    
     # stringify
     def __repr__(self) -> str:
-        return (f"origin: {self.origin}," 
+        return (f"origin: {self.origin},"
                 f"dest: {self.dest},"
                 f"minutes_left: {self.minutes_left},"
-                f"success: {self.success}")
\ No newline at end of file
+                f"success: {self.success}")
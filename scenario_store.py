@@ -0,0 +1,193 @@
+from __future__ import annotations
+import json
+import os
+import struct
+from typing import Dict, Iterator, List, Tuple
+import numpy as np
+from hourly_lambdas import DAYS, lambda_array, lambdas_from_array
+
+"""
+Many named demand scenarios (weekday, exam week, summer, +20% demand, ...) in one indexed
+binary file. Each scenario is a (hubs, 5, 24) lambda array plus, optionally, its destination
+probability blocks and travel time matrix. Reading a scenario by name seeks straight to its
+arrays and memory-maps them, so a sweep over scenarios never re-imports a Python module or
+regenerates lambdas.
+
+File layout:
+    MAGIC | array data, each array aligned to ALIGN bytes | JSON index | index offset (<Q) | MAGIC
+The index maps every name to its metadata and the offset, dtype and shape of its arrays.
+Adding a scenario rewrites only the index at the end of the file.
+
+    store = ScenarioStore("scenarios.mbs")
+    store.add("exam_week", Scenario(lambdas * 1.2, meta={"note": "+20%"}))
+    run_simulation(10, 5, **store["exam_week"].run_kwargs())
+"""
+
+MAGIC = b"MBSCNv1\0"
+ALIGN = 64
+_TAIL = struct.Struct("<Q")
+_ARRAYS = ("lambda_array", "blocks", "travel_time")
+
+
+class Scenario:
+    """ One demand scenario
+
+    Attributes
+    ----------
+    lambda_array: (hubs, 5, 24) - hourly lambdas per hub, day (DAYS order) and hour
+    blocks: (blocks, hubs, hubs) or None - destination probability blocks in the
+        new_probability.BLOCKS layout; None uses the built-in Middlebury blocks
+    travel_time: (hubs, hubs) or None - travel minutes; None uses constants.travel_time
+    meta: dict - anything JSON-serializable describing the scenario
+    """
+    def __init__(self,
+                 lambda_array: np.ndarray,
+                 blocks: np.ndarray | None = None,
+                 travel_time: np.ndarray | None = None,
+                 meta: Dict[str, object] | None = None,
+                ) -> None:
+        self.lambda_array = np.asarray(lambda_array)
+        if self.lambda_array.ndim != 3 or self.lambda_array.shape[1:] != (len(DAYS), 24):
+            raise ValueError(f"lambda_array must be (hubs, {len(DAYS)}, 24), got {self.lambda_array.shape}")
+        self.blocks = None if blocks is None else np.asarray(blocks)
+        self.travel_time = None if travel_time is None else np.asarray(travel_time)
+        self.meta = dict(meta or {})
+
+    @classmethod
+    def from_lambdas(cls, hourly_lambdas: Dict[int, Dict[str, Dict[int, int]]], **kwargs) -> Scenario:
+        """
+        A scenario from a dictionary in the converted_population layout.
+        """
+        return cls(lambda_array(hourly_lambdas), **kwargs)
+
+    @property
+    def num_hubs(self) -> int:
+        return self.lambda_array.shape[0]
+
+    def lambdas(self) -> Dict[int, Dict[str, Dict[int, float]]]:
+        """
+        lambda_array in the converted_population layout, ready for run_simulation.
+        """
+        return lambdas_from_array(self.lambda_array)
+
+    def probabilities(self):
+        """
+        build_probabilities for the scenario's blocks, or None when it has none.
+        """
+        if self.blocks is None:
+            return None
+        import simulation_main as sim
+        return sim.build_probabilities(self.num_hubs, self.blocks)
+
+    def run_kwargs(self) -> Dict[str, object]:
+        """
+        Keyword arguments for run_simulation; parts the scenario leaves out keep their defaults.
+        """
+        kwargs: Dict[str, object] = {"hourly_lambdas": np.asarray(self.lambda_array)}
+        if self.travel_time is not None:
+            kwargs["travel"] = self.travel_time
+        if self.blocks is not None:
+            kwargs["probabilities"] = self.probabilities()
+        return kwargs
+
+
+class ScenarioStore:
+    """ Named scenarios in one binary file, read by name with memory-mapped arrays
+
+    The file is created on the first add. Scenarios read from the store are read-only views
+    of the file.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def _read_index(self) -> Tuple[Dict[str, Dict[str, object]], int]:
+        """
+        returns:
+            index: name -> {"meta": ..., "arrays": {field: {"offset", "dtype", "shape"}}}
+            end: offset where the index starts, i.e. the end of the array data
+        """
+        if not os.path.exists(self.path):
+            return {}, len(MAGIC)
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{self.path} is not a scenario store")
+            f.seek(-(_TAIL.size + len(MAGIC)), os.SEEK_END)
+            (index_offset,) = _TAIL.unpack(f.read(_TAIL.size))
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{self.path} is truncated")
+            tail = f.tell() - _TAIL.size - len(MAGIC)
+            f.seek(index_offset)
+            index = json.loads(f.read(tail - index_offset).decode("utf-8"))
+        return index, index_offset
+
+    def names(self) -> List[str]:
+        return list(self._read_index()[0])
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._read_index()[0]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names())
+
+    def meta(self, name: str) -> Dict[str, object]:
+        return self._entry(self._read_index()[0], name)["meta"]
+
+    def _entry(self, index: Dict[str, Dict[str, object]], name: str) -> Dict[str, object]:
+        if name not in index:
+            raise KeyError(f"no scenario {name!r} in {self.path}; have {sorted(index)}")
+        return index[name]
+
+    def __getitem__(self, name: str) -> Scenario:
+        return self.read(name)
+
+    def read(self, name: str) -> Scenario:
+        """
+        The named scenario, its arrays memory-mapped from the file.
+        """
+        entry = self._entry(self._read_index()[0], name)
+        arrays = {field: np.memmap(self.path, dtype=spec["dtype"], mode="r",
+                                   offset=spec["offset"], shape=tuple(spec["shape"]))
+                  for field, spec in entry["arrays"].items()}
+        return Scenario(arrays["lambda_array"], arrays.get("blocks"), arrays.get("travel_time"),
+                        entry["meta"])
+
+    def add(self, name: str, scenario: Scenario, *, overwrite: bool = False) -> None:
+        """
+        Append scenario under name. With overwrite, an existing name is pointed at the new
+        arrays; the old ones stay in the file as dead bytes.
+        """
+        index, end = self._read_index()
+        if name in index and not overwrite:
+            raise ValueError(f"scenario {name!r} already in {self.path}, pass overwrite=True to replace it")
+        mode = "r+b" if os.path.exists(self.path) else "w+b"
+        with open(self.path, mode) as f:
+            if mode == "w+b":
+                f.write(MAGIC)
+            f.seek(end)
+            f.truncate()
+            specs: Dict[str, Dict[str, object]] = {}
+            for field in _ARRAYS:
+                array = getattr(scenario, field)
+                if array is None:
+                    continue
+                array = np.ascontiguousarray(array)
+                f.write(b"\0" * (-f.tell() % ALIGN))
+                specs[field] = {"offset": f.tell(), "dtype": array.dtype.str, "shape": list(array.shape)}
+                f.write(array.tobytes())
+            index[name] = {"meta": scenario.meta, "arrays": specs}
+            index_offset = f.tell()
+            f.write(json.dumps(index).encode("utf-8"))
+            f.write(_TAIL.pack(index_offset))
+            f.write(MAGIC)
+
+
+def middlebury_scenario() -> Scenario:
+    """
+    converted_population with the built-in blocks and travel times.
+    """
+    import constants
+    import new_probability as nwp
+    from converted_population import converted_population
+    return Scenario.from_lambdas(converted_population, blocks=np.array(nwp.BLOCKS, dtype=float),
+                                 travel_time=np.asarray(constants.travel_time),
+                                 meta={"source": "converted_population"})
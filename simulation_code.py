@@ -1,9 +1,17 @@
 from __future__ import annotations
 import numpy as np
 import random
-import networkx as nx
-from typing import Dict, List, Tuple
+import time
+from typing import TYPE_CHECKING, Dict, List, Tuple
 from request import Request
+from instrumentation import SimulationMetrics
+from sparse_probability import DestinationCSR
+from batch_simulation import DestinationTable
+
+# networkx is only needed to build or read a digraph; simulation() on a travel time
+# matrix never imports it
+if TYPE_CHECKING:
+    import networkx as nx
 
 def build_complete_digraph(travel_time: np.ndarray) -> nx.DiGraph:
     """
@@ -16,34 +24,65 @@ def build_complete_digraph(travel_time: np.ndarray) -> nx.DiGraph:
     Returns:
     G - complete digraph G populated based on data provided
     """
+    import networkx as nx
+
     n = travel_time.shape[0] # should be 10, since the matrix [10, 10][0] = 10
     G = nx.complete_graph(n, create_using = nx.DiGraph)
     for u, v in G.edges: # for edge uv, the label time = travel_time[u, v]
         G.edges[u, v]["time"] = int(travel_time[u, v])
     return G
 
+def travel_matrix(G: nx.DiGraph | np.ndarray) -> np.ndarray:
+    """
+    Travel times as a dense matrix. A matrix is returned as is; a digraph from
+    build_complete_digraph is read off its 'time' edge attribute. A digraph that is not
+    complete gives a float matrix with np.inf where there is no edge, never a free move.
+    """
+    if isinstance(G, np.ndarray):
+        return G
+    import networkx as nx
+
+    n = G.number_of_nodes()
+    times = nx.to_numpy_array(G, nodelist=range(n), weight="time", nonedge=np.inf)
+    np.fill_diagonal(times, 0)
+    if np.isinf(times).any():
+        return times
+    return times.astype(int)
+
 def simulation(
-        G: nx.DiGraph,
+        G: nx.DiGraph | np.ndarray,
         distribution: Dict[int, np.ndarray],
-        possibilities: Dict[int, Dict[str, np.ndarray]],
+        possibilities: Dict[int, Dict[str, np.ndarray]] | DestinationCSR | DestinationTable,
         *,
         max_bikes_per_hub: int = 10,
         initial_bikes_per_hub: int = 5,
         rng: np.random.Generator | None = None,
+        keep_log: bool = True,
+        metrics: SimulationMetrics | None = None,
 ) -> Tuple[np.ndarray, np.ndarray, List[Request]]:
     """
     Parameters:
-    G - K_11 generated from data
+    G - K_11 generated from data, or the travel time matrix itself (use the matrix for large networks,
+        a complete digraph on thousands of hubs does not fit in memory); every travel time must
+        be finite, ValueError otherwise
     distribution - 24-element np.ndarray hourly rental requests at each hub
-    possibilities - 11-element destination probabilities for each hub, [origin][origin] must be 0.0
+    possibilities - 11-element destination probabilities for each hub, [origin][origin] must be 0.0,
+        or a sparse_probability.DestinationCSR that destinations are sampled from directly, or a
+        batch_simulation.DestinationTable wrapping either (reuse one across calls to keep its row cache)
     keyword args - must be passed with name
         max_bikes_per_hub - 10
         initial_bikes_per_hub - 5 for simplicity 
         rng - NumPy generator for reproducibility
+        keep_log - build a Request for every rental and return them; when False,
+            trips are tracked as plain (minutes_left, dest) lists and no Request
+            objects are allocated
+        metrics - optional SimulationMetrics that accumulates in-transit counts, checkout
+            attempts, overflow redirects and phase timings; None skips all bookkeeping
 
     Returns:
     no_bike_events - 24-element np.ndarray representing the no. of no-bike events every hour in the system
     no_parking_events - 24-element np.ndarray representing the no. of no-space events every hour in the system
+    all_requests - one Request per rental in the order they happened (empty when keep_log is False)
 
     """
     
@@ -51,100 +90,146 @@ def simulation(
     if rng is None:
         rng = np.random.default_rng()
 
-    num_hubs = G.number_of_nodes()
+    times = travel_matrix(G)
+    if times.dtype.kind == "f" and not np.isfinite(times).all():
+        # e.g. a digraph that is not complete; only the rebalancing planner routes around gaps
+        raise ValueError("simulation needs a finite travel time between every pair of hubs")
+    num_hubs = times.shape[0]
+    # normalized destination rows, computed once per (hub, hour) instead of per rental
+    if isinstance(possibilities, DestinationTable):
+        destinations = possibilities
+    else:
+        destinations = DestinationTable(possibilities, num_hubs)
+    # hubs ordered by distance from each hub, filled in the first time a hub overflows
+    nearest: Dict[int, np.ndarray] = {}
 
-    # pre-build request objects
-    req_pool: Dict[int, List[Request]] = {}
     all_requests: List[Request] = []
-    for hub in range(num_hubs):
-        n_req = int(distribution[hub].sum())
-        bag = [Request() for _ in range(n_req)]
-        req_pool[hub] = bag
-        all_requests.extend(bag) #add list of requests to incrementing indices of all_requests
     
     bike_stock = np.full(num_hubs, initial_bikes_per_hub, dtype = int) # 10-element array, no. of bikes at each hub
     
-    # trips currently on the road, each element (minutes_remaining, destination_hub)
-    in_transit: List[Request] = []
+    # trips currently on the road, stored column-wise as arrays: minutes remaining,
+    # destination hub and (only when keep_log) the Request the trip belongs to
+    transit_minutes = np.empty(0, dtype = int)
+    transit_dest = np.empty(0, dtype = int)
+    transit_req: List[Request] = []
 
     no_bike_events = np.zeros(24, dtype = int) # sum of no-bike events, each hour of the day
     no_parking_events = np.zeros(24, dtype = int) # sum of no-parking events, each hour of the day
 
+    if metrics is not None:
+        metrics.days += 1
+
     for hour in range(24):
 
+        if metrics is not None:
+            metrics.in_transit[hour] += len(transit_minutes)
+            phase_start = time.perf_counter()
+
         # for simplicity, advance all in-transit bikes by 60 mins
         # dock whose remaining time has hit zero or below
-        # on_road: array of requests still riding after the current hour is processed
-        on_road: List[Request] = []
-        
-        for req in in_transit:
-            req.minutes_left -= 60
-
-            if req.minutes_left > 0:
-                on_road.append(req)
-                continue
-
-            dest = req.dest
-            
-            # attempt to dock a bike at dest
-            if bike_stock[dest] < max_bikes_per_hub:
-                bike_stock[dest] += 1
-                continue
-            
-            else:
-                no_parking_events[hour] += 1
-
+        transit_minutes = transit_minutes - 60
+        arriving = transit_minutes <= 0
+        arrival_dest = transit_dest[arriving]
+
+        # dock arrivals in trip order up to each hub's free space, the rest overflow
+        arrivals = np.bincount(arrival_dest, minlength = num_hubs)
+        docked = np.minimum(arrivals, np.maximum(max_bikes_per_hub - bike_stock, 0))
+        overflow = arrivals - docked
+        bike_stock += docked
+        no_parking_events[hour] = overflow.sum()
+
+        overflowed = np.zeros(len(transit_minutes), dtype = bool)
+        if no_parking_events[hour]:
+            # rank of each arriving trip among the arrivals at its hub; ranks past the
+            # docked count are the trips that found the hub full
+            order = np.argsort(arrival_dest, kind = "stable")
+            group_start = np.cumsum(arrivals) - arrivals
+            rank = np.empty(len(arrival_dest), dtype = int)
+            rank[order] = np.arange(len(arrival_dest)) - group_start[arrival_dest[order]]
+            overflowed[arriving] = rank >= docked[arrival_dest]
+
+        # send each full hub's overflow to the nearest hub with a free dock after this
+        # hour's docking, or keep it riding to the same hub for another hour
+        new_dest = np.arange(num_hubs)
+        new_minutes = np.full(num_hubs, 60)
+        for dest in np.flatnonzero(overflow):
             # sort edges so that no-parking events go to nearest hub
-            candidates = sorted(
-                (v for v in range(num_hubs) if v != dest),
-                key=lambda v: G.edges[dest, v]["time"]
-            )
-
-            chosen_hub = None
-            extra_time = 0
-            for v in candidates:
-                if bike_stock[v] < max_bikes_per_hub:
-                    chosen_hub = v
-                    extra_time = G.edges[dest, v]["time"]
-                    break
-            
-            if chosen_hub is None:
-                req.minutes_left = 60
-                on_road.append(req)
-            else:
-                req.dest = chosen_hub
-                req._minutes_left = extra_time
-                on_road.append(req)
-       
-        in_transit = on_road
+            candidates = nearest.get(dest)
+            if candidates is None:
+                candidates = np.argsort(times[dest], kind = "stable")
+                candidates = candidates[candidates != dest]
+                nearest[dest] = candidates
+            has_space = bike_stock[candidates] < max_bikes_per_hub
+            found = bool(has_space.any())
+            if found:
+                chosen_hub = candidates[has_space.argmax()]
+                new_dest[dest] = chosen_hub
+                new_minutes[dest] = times[dest, chosen_hub]
+
+            if metrics is not None:
+                metrics.redirect_search_lengths.append(int(has_space.argmax()) + 1 if found else len(candidates))
+                if found:
+                    metrics.overflow_redirects[hour] += overflow[dest]
+                else:
+                    metrics.overflow_stranded[hour] += overflow[dest]
+
+        redirect_from = transit_dest[overflowed]
+        transit_dest[overflowed] = new_dest[redirect_from]
+        transit_minutes[overflowed] = new_minutes[redirect_from]
+
+        # road: trips still riding after the current hour is processed
+        on_road = ~arriving | overflowed
+        if keep_log:
+            for req, minutes_left, dest in zip(transit_req, transit_minutes.tolist(), transit_dest.tolist()):
+                req.minutes_left = minutes_left
+                req.dest = dest
+            transit_req = [req for req, riding in zip(transit_req, on_road.tolist()) if riding]
+        transit_minutes = transit_minutes[on_road]
+        transit_dest = transit_dest[on_road]
+
+        if metrics is not None:
+            now = time.perf_counter()
+            metrics.dock_seconds[hour] += now - phase_start
+            phase_start = now
 
         # process rental requests that occur during this hour
+        new_trip_minutes: List[np.ndarray] = [transit_minutes]
+        new_trip_dest: List[np.ndarray] = [transit_dest]
+        # checkouts at a hub succeed one after another until it runs dry, so the outcome is
+        # closed-form: min(stock, requests) rentals, the rest no-bike events, and the
+        # destinations of all rentals are drawn at once
         for hub in range(num_hubs):
-            for _ in range(int(distribution[hub][hour])):
-                req = req_pool[hub].pop() if req_pool[hub] else Request()
-                all_requests.append(req)
-                req.origin = hub
-
-                # attempt to rent at hub
-                if bike_stock[hub] == 0: # if no bike left
-                    no_bike_events[hour] += 1
-                    req.success = False
-                    continue
-
-                # successful checkout
-                bike_stock[hub] -= 1
-                p = possibilities[hub][hour]  # missing self-loop
-                p = np.array(p, dtype=float)
-                p = p / p.sum() if p.sum() > 0 else np.full(num_hubs, 1 / num_hubs)
-                dest = rng.choice(num_hubs, p=p) #chat says to nomalize it
-                req.dest = dest
-                #trip duration from edge attribute in G
-                if hub == dest:
-                    continue
-                    # raise ValueError(f"Self-loop trip requested from hub {hub} to itself, which is invalid.")
-                req.minutes_left = int(G.edges[hub, dest]["time"])
-                req.success = True
-                in_transit.append(req)
+            requests = int(distribution[hub][hour])
+            if requests == 0:
+                continue
+            rented = min(requests, int(bike_stock[hub]))
+            no_bike_events[hour] += requests - rented
+            bike_stock[hub] -= rented
+
+            dests = np.empty(0, dtype=int)
+            if rented:
+                dests = destinations.sample(hub, hour, rented, rng)
+                #trip duration from the travel time matrix; a trip back to hub itself leaves the system
+                moving = dests[dests != hub]
+                new_trip_minutes.append(times[hub, moving])
+                new_trip_dest.append(moving)
+
+            if keep_log:
+                for dest in dests.tolist():
+                    if dest == hub:
+                        all_requests.append(Request(origin = hub, dest = dest))
+                        continue
+                    req = Request(origin = hub, dest = dest, minutes_left = int(times[hub, dest]), success = True)
+                    all_requests.append(req)
+                    transit_req.append(req)
+                all_requests.extend(Request(origin = hub) for _ in range(requests - rented))
+
+        transit_minutes = np.concatenate(new_trip_minutes).astype(int)
+        transit_dest = np.concatenate(new_trip_dest).astype(int)
+
+        if metrics is not None:
+            metrics.checkout_attempts[hour] += sum(int(distribution[hub][hour]) for hub in range(num_hubs))
+            metrics.rental_seconds[hour] += time.perf_counter() - phase_start
     
 
-    return no_bike_events, no_parking_events, all_requests
\ No newline at end of file
+    return no_bike_events, no_parking_events, all_requests
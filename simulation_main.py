@@ -1,21 +1,44 @@
-from typing import Dict, Tuple, List
+from __future__ import annotations
+import argparse
+from typing import Dict, Tuple, List, Mapping, Sequence
 from numpy.typing import NDArray
 import numpy as np
-from converted_population import converted_population
-from testdata import size_dictionary
-from constants import elevation_matrix, travel_time, size_dictionary
+from constants import travel_time
 import non_homogenous_poisson as nhp
-import hourly_usage_and_probability as dest_prob
 import simulation_code as code
-import matplotlib.pyplot as plt
+import batch_simulation as batch
+from hourly_lambdas import lambda_matrix
 import new_probability as nwp
+from instrumentation import SimulationMetrics
+from sparse_probability import DestinationCSR
+from seeding import SeedStreams
+from demand_models import DemandModel, PoissonDemand
+
+"""
+Headless library entry point: importing this module loads NumPy and the small pipeline
+modules only. matplotlib is imported by plot_results, and converted_population the first
+time run_simulation needs its default lambdas, so sweep workers that pass their own
+inputs never pay for either.
+"""
+
+
+def default_lambdas() -> Dict[int, Dict[str, Dict[int, int]]]:
+    """
+    The converted_population scenario, imported on first use.
+    """
+    from converted_population import converted_population
+    return converted_population
 
 
 def build_distributions(
-    hourly_lambdas: Dict[int, Dict[str, Dict[int, int]]],
+    hourly_lambdas: Dict[int, Dict[str, Dict[int, int]]] | np.ndarray,
     T: int, 
     day: str,
-    num_hubs: int) -> Tuple[Dict[int, np.ndarray], Dict[int, np.ndarray]]:
+    num_hubs: int,
+    rng: np.random.Generator | None = None,
+    *,
+    counts_only: bool = False,
+    demand_model: DemandModel | None = None) -> Tuple[Dict[int, np.ndarray], Mapping[int, np.ndarray]]:
     """
     Calls data from converted_population. Extracts a specific day's distribution data from each station key.
     Calls nonhomogenous poisson function to build a set of new bike request timestamps for each station, then bins the timestamps into hourly
@@ -28,42 +51,60 @@ def build_distributions(
         T: the amount of time nonhomogenous poisson runs for (should be 24 hours)
         day: each hourly lambda array represents 1 day worth of data. This day parameter specifies which day from the data you're using.
         num_hubs: the number of bike stations
+        rng: generator shared by every hub's nonhomogenous poisson draw, fresh entropy when None
+        counts_only: draw the hourly counts directly as independent Poisson(lambda) variables,
+            which is what binning nhp's piecewise-constant-rate timestamps gives, and skip the
+            sampler and the binning. Timestamps are then only drawn for the hubs a caller
+            looks up (nhp.LazyTimestamps); the hourly simulation() never does.
+        demand_model: draw the day from this demand_models.DemandModel instead, e.g. a
+            day_archive.BootstrapDemand resampling recorded days
     returns:
         poisson: a dictionary with each station as a key and their corresponding nonhomogenous request distribution as a value.
         timestamps: the nonhomogenous set of times at which each request occurs
+    hourly_lambdas can also be a (hubs, 5, 24) lambda array, e.g. a scenario_store scenario.
     """
+    if demand_model is not None:
+        return demand_model.build_distributions(hourly_lambdas, T, day, num_hubs, rng)
     poisson: Dict[int, np.ndarray] = {}
     timestamps: Dict[int, np.ndarray] = {}
+    rates = lambda_matrix(hourly_lambdas, day, num_hubs)
+    if counts_only:
+        if rng is None:
+            rng = np.random.default_rng()
+        counts = rng.poisson(rates)
+        return dict(enumerate(counts)), nhp.LazyTimestamps(counts, rng)
 
     for hub in range(num_hubs):
-        timestamps[hub] = nhp.nhp(hourly_lambdas[hub][day]) #timestamps within T = 24 hours for station "hub"
+        timestamps[hub] = nhp.nhp(rates[hub], seed=rng) #timestamps within T = 24 hours for station "hub"
         poisson[hub] = nhp.bin_events_by_hour(timestamps[hub], T) #bin timestamps withn 24 hour slots for each hub
     return poisson, timestamps
 
 
 def build_probabilities(
-    num_hubs: int
+    num_hubs: int,
+    blocks: Sequence[np.ndarray] | None = None,
     ) -> Dict[int, Dict[str, np.ndarray]]:
     """
     For each source, calculates the probs to travel from source to destinations 0-9 for each hour of the day.
     params: 
         num_hubs: number of bike stations
+        blocks: five num_hubs x num_hubs block matrices in new_probability.HOUR_TO_BLOCK order,
+            defaults to the Middlebury matrices in constants
     returns: 
         res: dictionaries with station (sources) as keys, and dictionaries of size 24 as values.
-        Within these 24 value dictionaries, each key is an hour of the day, and each value is an array of size num_hubs - 1 that
-        shows the probabilites of going from the source (the outermost key) to each other station at a specific hour.
+        Within these 24 value dictionaries, each key is an hour of the day, and each value is an array of size num_hubs
+        that shows the probabilites of going from the source (the outermost key) to each other station at a specific hour.
+        The arrays are read-only views into the block matrices, so nothing hubs x hubs x 24 is allocated.
     """
+    if blocks is None:
+        blocks = nwp.BLOCKS
     res = {}
     for source in range(num_hubs):
         inner = {}
         for hour in range(24):
-            temp = []
-            for dest in range(num_hubs):
-                if source == dest:
-                    prob = 0.0
-                prob = nwp.calculate_probability(hour,source,dest)
-                temp.append(prob)
-            inner[hour] = temp
+            row = np.asarray(blocks[nwp.HOUR_TO_BLOCK[hour]])[source].view()
+            row.flags.writeable = False
+            inner[hour] = row
         res[source] = inner
     return res
 
@@ -71,42 +112,201 @@ def build_probabilities(
 def run_simulation(
     max_bikes_per_hub: int,
     initial_bikes_per_hub: int,
-    ) -> Tuple[int, int]:
+    *,
+    hourly_lambdas: Dict[int, Dict[str, Dict[int, int]]] | np.ndarray | None = None,
+    day: str = "W",
+    travel: np.ndarray = travel_time,
+    probabilities: Dict[int, Dict[str, np.ndarray]] | DestinationCSR | None = None,
+    replications: int = 100,
+    metrics: SimulationMetrics | None = None,
+    rng: np.random.Generator | None = None,
+    seed: int | SeedStreams | None = None,
+    first_replication: int = 0,
+    vectorized: bool = False,
+    batch_size: int | None = None,
+    demand_model: DemandModel | None = None,
+    ) -> Tuple[float, float]:
     """
-    Runs simulation_code for a specific day of the week. 
+    Runs simulation_code for a specific day of the week. Each replication's demand is drawn
+    as hourly counts from demand_model, no timestamps.
+    keyword args:
+        hourly_lambdas: lambdas in the converted_population layout or a (hubs, 5, 24) lambda
+            array, defaults to converted_population (see default_lambdas)
+        day: which day of the week to simulate
+        travel: travel time matrix, its size sets the number of hubs. It goes straight to
+            simulation(), so no networkx graph is built and networks with thousands of hubs fit in memory.
+        probabilities: destination probabilities in the build_probabilities layout or a
+            sparse_probability.DestinationCSR, defaults to build_probabilities(num_hubs)
+        replications: number of simulated days averaged over
+        metrics: optional SimulationMetrics; collects simulation() counters and the time
+            spent in each stage of the loop below
+        rng: one generator shared by arrivals and destinations of every replication
+        seed: root seed or SeedStreams; replication r draws arrivals and destinations from
+            the independent streams of seed.replication(r), so runs are reproducible and two
+            configurations with the same seed share arrivals. Used when rng is None; fresh
+            entropy when both are None
+        first_replication: index of the first replication's streams, so a run split into
+            chunks (e.g. across workers) reproduces the unsplit run
+        vectorized: run all replications in lockstep with batch_simulation.simulate_batch,
+            batch_size replications per set of array operations (all of them when None).
+            Seeded runs are reproducible but use batch-wide streams, so they do not match
+            the per-replication engine draw for draw; a chunk with first_replication > 0
+            draws from the streams of seed.replication(first_replication), so chunks never
+            repeat each other's replications, but they do not reproduce the unsplit run
+        demand_model: a demand_models.DemandModel for the hourly request counts, independent
+            Poisson counts (PoissonDemand, the same draws as build_distributions with
+            counts_only) when None
+    returns:
+        mean no-bike events and mean no-parking events per simulated day
     """
+    if rng is not None and seed is not None:
+        raise ValueError("pass either rng or seed, not both")
+    if hourly_lambdas is None:
+        hourly_lambdas = default_lambdas()
+    streams = seed if isinstance(seed, SeedStreams) else SeedStreams(seed)
+    if demand_model is None:
+        demand_model = PoissonDemand()
+    num_hubs = travel.shape[0]
     no_bike_sum = 0
     no_parking_sum = 0
 
-    for _ in range(100):
-        distribution = build_distributions(converted_population, 24, "W", 10)
+    if vectorized:
+        if metrics is not None:
+            raise ValueError("metrics are only collected by the per-replication engine")
+        return _run_simulation_vectorized(max_bikes_per_hub, initial_bikes_per_hub, hourly_lambdas, day,
+                                          travel, probabilities, replications, rng, streams, batch_size,
+                                          demand_model, first_replication)
+
+    if metrics is not None:
+        return _run_simulation_instrumented(max_bikes_per_hub, initial_bikes_per_hub, hourly_lambdas,
+                                            day, travel, probabilities, replications, metrics, rng, streams,
+                                            first_replication, demand_model)
+
+    probs = build_probabilities(num_hubs) if probabilities is None else probabilities
+    probs = batch.DestinationTable(probs, num_hubs)
+
+    for r in range(first_replication, first_replication + replications):
+        arrivals_rng, destinations_rng = _replication_rngs(r, rng, streams)
+        distribution = demand_model.build_distributions(hourly_lambdas, 24, day, num_hubs, arrivals_rng)
         poisson = distribution[0]
         timestamps = distribution[1]
-        probs = build_probabilities(10)
-        graph = code.build_complete_digraph(travel_time)
-        no_bike, no_parking, requests = code.simulation(graph, poisson, probs, max_bikes_per_hub=max_bikes_per_hub, initial_bikes_per_hub=initial_bikes_per_hub)
+        no_bike, no_parking, _ = code.simulation(travel, poisson, probs, max_bikes_per_hub=max_bikes_per_hub, initial_bikes_per_hub=initial_bikes_per_hub, keep_log=False, rng=destinations_rng)
         no_bike_sum += no_bike.sum()
         no_parking_sum += no_parking.sum()
 
-    return no_bike_sum/100, no_parking_sum/100  
+    return no_bike_sum/replications, no_parking_sum/replications  
 
-if __name__ == "__main__":
-    bikestock = [5, 10, 15, 20, 25]
-    bikestands = [10, 20, 30, 40, 50]
-    res = []
-    for _ in range(5, 30, 5):
-        events = run_simulation(_*2, _)
-        res.append(events)
 
-    no_bike = []
-    no_parking = []
-    for _ in res:
-        no_bike.append(_[0])
-        no_parking.append(_[1])
-    
-    print(no_bike)
-    print(no_parking)
-    
+def _replication_rngs(
+    index: int,
+    rng: np.random.Generator | None,
+    streams: SeedStreams,
+    ) -> Tuple[np.random.Generator, np.random.Generator]:
+    """
+    Arrival and destination generators for replication index: the shared rng when one was
+    passed, otherwise the replication's own streams.
+    """
+    if rng is not None:
+        return rng, rng
+    rep = streams.replication(index)
+    return rep.generator("arrivals"), rep.generator("destinations")
+
+
+def _run_simulation_vectorized(
+    max_bikes_per_hub: int,
+    initial_bikes_per_hub: int,
+    hourly_lambdas: Dict[int, Dict[str, Dict[int, int]]] | np.ndarray,
+    day: str,
+    travel: np.ndarray,
+    probabilities: Dict[int, Dict[str, np.ndarray]] | DestinationCSR | None,
+    replications: int,
+    rng: np.random.Generator | None,
+    streams: SeedStreams,
+    batch_size: int | None,
+    demand_model: DemandModel,
+    first_replication: int = 0,
+    ) -> Tuple[float, float]:
+    """
+    run_simulation on the lockstep engine, batch_size replications at a time. A chunk that
+    starts past replication 0 gets its own batch-wide streams.
+    """
+    num_hubs = travel.shape[0]
+    probs = build_probabilities(num_hubs) if probabilities is None else probabilities
+    destinations = batch.DestinationTable(probs, num_hubs)
+    lam = lambda_matrix(hourly_lambdas, day, num_hubs)
+    if first_replication:
+        streams = streams.replication(first_replication)
+    arrivals_rng = rng if rng is not None else streams.generator("arrivals")
+    destinations_rng = rng if rng is not None else streams.generator("destinations")
+    batch_size = replications if batch_size is None else batch_size
+
+    no_bike_sum = 0
+    no_parking_sum = 0
+    for start in range(0, replications, batch_size):
+        reps = min(batch_size, replications - start)
+        demand = demand_model.sample_counts(lam, reps, arrivals_rng)
+        no_bike, no_parking = batch.simulate_batch(travel, demand, probs, max_bikes_per_hub=max_bikes_per_hub,
+                                                   initial_bikes_per_hub=initial_bikes_per_hub,
+                                                   rng=destinations_rng, destinations=destinations)
+        no_bike_sum += no_bike.sum()
+        no_parking_sum += no_parking.sum()
+
+    return no_bike_sum/replications, no_parking_sum/replications
+
+
+def _run_simulation_instrumented(
+    max_bikes_per_hub: int,
+    initial_bikes_per_hub: int,
+    hourly_lambdas: Dict[int, Dict[str, Dict[int, int]]] | np.ndarray,
+    day: str,
+    travel: np.ndarray,
+    probabilities: Dict[int, Dict[str, np.ndarray]] | DestinationCSR | None,
+    replications: int,
+    metrics: SimulationMetrics,
+    rng: np.random.Generator | None,
+    streams: SeedStreams,
+    first_replication: int,
+    demand_model: DemandModel,
+    ) -> Tuple[float, float]:
+    """
+    Same loop as run_simulation with every stage wrapped in a metrics timer. Kept separate
+    so the uninstrumented loop carries no timer overhead.
+    """
+    num_hubs = travel.shape[0]
+    no_bike_sum = 0
+    no_parking_sum = 0
+
+    with metrics.stage("build_probabilities"):
+        probs = build_probabilities(num_hubs) if probabilities is None else probabilities
+        probs = batch.DestinationTable(probs, num_hubs)
+
+    for r in range(first_replication, first_replication + replications):
+        arrivals_rng, destinations_rng = _replication_rngs(r, rng, streams)
+        with metrics.stage("build_distributions"):
+            poisson, timestamps = demand_model.build_distributions(hourly_lambdas, 24, day, num_hubs,
+                                                                   arrivals_rng)
+        with metrics.stage("simulation"):
+            no_bike, no_parking, _ = code.simulation(travel, poisson, probs, max_bikes_per_hub=max_bikes_per_hub,
+                                                     initial_bikes_per_hub=initial_bikes_per_hub, keep_log=False,
+                                                     metrics=metrics, rng=destinations_rng)
+        no_bike_sum += no_bike.sum()
+        no_parking_sum += no_parking.sum()
+
+    return no_bike_sum/replications, no_parking_sum/replications
+
+
+def plot_results(
+    bikestock: List[int],
+    bikestands: List[int],
+    no_bike: List[float],
+    no_parking: List[float],
+    ) -> None:
+    """
+    Scatter no-bike events against per-hub bike stock and no-parking events against per-hub
+    bike stands, and show the figure. matplotlib is imported here so headless callers never load it.
+    """
+    import matplotlib.pyplot as plt
+
     fig, axes = plt.subplots(2, 1, figsize = (8, 6))
     (ax11, ax12) = axes
 
@@ -124,3 +324,35 @@ if __name__ == "__main__":
 
     fig.subplots_adjust(hspace=0.5)
     plt.show()
+
+
+def main(argv: List[str] | None = None) -> None:
+    """
+    Run the stock/stand sweep and plot it, or only print it with --no-plot.
+    """
+    parser = argparse.ArgumentParser(description="Sweep per-hub bike stock and stands.")
+    parser.add_argument("--no-plot", action="store_true", help="print the results without loading matplotlib")
+    args = parser.parse_args(argv)
+
+    bikestock = [5, 10, 15, 20, 25]
+    bikestands = [10, 20, 30, 40, 50]
+    res = []
+    for _ in range(5, 30, 5):
+        events = run_simulation(_*2, _)
+        res.append(events)
+
+    no_bike = []
+    no_parking = []
+    for _ in res:
+        no_bike.append(_[0])
+        no_parking.append(_[1])
+    
+    print(no_bike)
+    print(no_parking)
+
+    if not args.no_plot:
+        plot_results(bikestock, bikestands, no_bike, no_parking)
+
+
+if __name__ == "__main__":
+    main()
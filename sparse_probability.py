@@ -0,0 +1,151 @@
+from __future__ import annotations
+from typing import Dict, Sequence, Tuple
+import numpy as np
+import new_probability as nwp
+
+"""
+Sparse destination probabilities for large networks. Riders mostly go to nearby hubs, so
+each (source, hour) keeps only its k most likely destinations, stored CSR-style with a
+cumulative distribution per row that simulation() samples from directly. Hours that share
+a block of the clock share rows, so memory is O(hubs * k * tables) with at most 24 tables,
+against O(hubs^2 * 24) for the dense build_probabilities layout.
+"""
+
+
+class DestinationCSR:
+    """ Per-source destination distributions in compressed sparse row form
+
+    Row table * num_hubs + source holds the destinations of source during every hour
+    mapped to table by hour_table.
+
+    Attributes
+    ----------
+    num_hubs: int
+    indptr: (rows + 1,) int64 - row r spans indices[indptr[r]:indptr[r + 1]]
+    indices: (nnz,) int32 - destination hubs
+    cdf: (nnz,) float64 - running probability within each row, ending at 1.0
+    hour_table: (24,) int - table used at each hour of the day
+    """
+    def __init__(self,
+                 num_hubs: int,
+                 indptr: np.ndarray,
+                 indices: np.ndarray,
+                 cdf: np.ndarray,
+                 hour_table: np.ndarray
+                ) -> None:
+        self.num_hubs = num_hubs
+        self.indptr = indptr
+        self.indices = indices
+        self.cdf = cdf
+        self.hour_table = np.asarray(hour_table)
+
+    @property
+    def nbytes(self) -> int:
+        return self.indptr.nbytes + self.indices.nbytes + self.cdf.nbytes
+
+    def _span(self, source: int, hour: int) -> Tuple[int, int]:
+        row = int(self.hour_table[hour]) * self.num_hubs + source
+        return int(self.indptr[row]), int(self.indptr[row + 1])
+
+    def row(self, source: int, hour: int) -> np.ndarray:
+        """
+        Dense num_hubs probability vector of source at hour (zeros when the row is empty).
+        """
+        start, stop = self._span(source, hour)
+        probs = np.zeros(self.num_hubs)
+        probs[self.indices[start:stop]] = np.diff(self.cdf[start:stop], prepend=0.0)
+        return probs
+
+    def sample(self, source: int, hour: int, rng: np.random.Generator, size: int | None = None):
+        """
+        Draw destinations for rentals at source during hour by inverting the row's cdf.
+        A row with no destinations falls back to a uniform draw over all hubs, the same
+        fallback simulation() uses for an all-zero dense row.
+        returns:
+            one hub index, or an array of size hub indices
+        """
+        start, stop = self._span(source, hour)
+        if start == stop:
+            return rng.integers(self.num_hubs, size=size)
+        u = rng.random(size)
+        pos = np.searchsorted(self.cdf[start:stop], u, side="right")
+        pos = np.minimum(pos, stop - start - 1)  # guards u landing above a cdf that rounds below 1
+        return self.indices[start + pos]
+
+
+def top_k_rows(probs: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The k largest entries of every row of probs.
+    returns:
+        indices: (rows, k) destination hubs, most likely first
+        values: (rows, k) their probabilities
+    """
+    k = min(k, probs.shape[1])
+    part = np.argpartition(-probs, k - 1, axis=1)[:, :k]
+    values = np.take_along_axis(probs, part, axis=1)
+    order = np.argsort(-values, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+
+def from_top_k(
+    indices: np.ndarray,
+    values: np.ndarray,
+    hour_table: np.ndarray,
+    ) -> DestinationCSR:
+    """
+    Build a DestinationCSR from per-table top-k arrays.
+    params:
+        indices, values: (tables, num_hubs, k) destinations and probabilities, e.g. from top_k_rows
+        hour_table: (24,) table used at each hour
+    Zero-probability entries are dropped and every remaining row is renormalized to sum to 1,
+    so the mass beyond the top k is spread proportionally over the kept destinations.
+    """
+    tables, num_hubs, k = indices.shape
+    indices = indices.reshape(tables * num_hubs, k)
+    values = values.reshape(tables * num_hubs, k).astype(float)
+    keep = values > 0
+    counts = keep.sum(axis=1)
+    indptr = np.zeros(tables * num_hubs + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+
+    totals = values.sum(axis=1, keepdims=True)
+    cdf = np.cumsum(np.divide(values, totals, out=np.zeros_like(values), where=totals > 0), axis=1)
+    # rows are sorted most likely first, so the kept entries are a prefix and the last kept
+    # cumulative value is the row total; pin it to exactly 1.0
+    cdf[np.arange(len(counts))[counts > 0], counts[counts > 0] - 1] = 1.0
+    return DestinationCSR(num_hubs, indptr, indices[keep].astype(np.int32), cdf[keep], hour_table)
+
+
+def from_blocks(
+    blocks: Sequence[np.ndarray],
+    k: int,
+    *,
+    hour_to_block: np.ndarray = nwp.HOUR_TO_BLOCK,
+    chunk: int = 512,
+    ) -> DestinationCSR:
+    """
+    Sparsify dense block matrices (new_probability.BLOCKS layout) to their top k destinations
+    per row, reading chunk rows at a time.
+    """
+    num_hubs = np.asarray(blocks[0]).shape[0]
+    k = min(k, num_hubs)
+    indices = np.empty((len(blocks), num_hubs, k), dtype=np.int32)
+    values = np.empty((len(blocks), num_hubs, k), dtype=float)
+    for table, block in enumerate(blocks):
+        for start in range(0, num_hubs, chunk):
+            rows = slice(start, min(start + chunk, num_hubs))
+            indices[table, rows], values[table, rows] = top_k_rows(np.asarray(block[rows], dtype=float), k)
+    return from_top_k(indices, values, hour_to_block)
+
+
+def from_probabilities(
+    possibilities: Dict[int, Dict[int, np.ndarray]],
+    k: int,
+    ) -> DestinationCSR:
+    """
+    Sparsify a build_probabilities result, one table per hour.
+    """
+    num_hubs = len(possibilities)
+    hourly = [np.array([possibilities[source][hour] for source in range(num_hubs)], dtype=float)
+              for hour in range(24)]
+    return from_blocks(hourly, k, hour_to_block=np.arange(24))
@@ -0,0 +1,75 @@
+import numpy as np
+import batch_simulation as batch
+import simulation_code as code
+
+
+def _one_hot_network():
+    # three hubs, every rider from hub i goes to hub (i + 1) % 3, so no destination draw is random
+    travel = np.array([[0, 20, 40], [20, 0, 20], [40, 20, 0]])
+    possibilities = {hub: {hour: np.eye(3)[(hub + 1) % 3] for hour in range(24)} for hub in range(3)}
+    demand = np.zeros((3, 24), dtype=int)
+    demand[0, 6:10] = [4, 6, 3, 2]
+    demand[1, 8:12] = [5, 1, 4, 2]
+    demand[2, 12:18] = 3
+    return travel, possibilities, demand
+
+
+def test_stock_above_capacity_matches_simulation():
+    travel, possibilities, demand = _one_hot_network()
+    for stock, capacity in [(15, 10), (25, 10), (5, 10)]:
+        expected_bike, expected_parking, _ = code.simulation(
+            travel, dict(enumerate(demand)), possibilities, max_bikes_per_hub=capacity,
+            initial_bikes_per_hub=stock, keep_log=False, rng=np.random.default_rng(0))
+        no_bike, no_parking = batch.simulate_batch(
+            travel, demand[None], possibilities, max_bikes_per_hub=capacity,
+            initial_bikes_per_hub=stock, rng=np.random.default_rng(0))
+        np.testing.assert_array_equal(no_bike[0], expected_bike)
+        np.testing.assert_array_equal(no_parking[0], expected_parking)
+
+
+def test_stock_above_capacity_never_docks_negative():
+    travel, possibilities, demand = _one_hot_network()
+    no_bike, no_parking = batch.simulate_batch(
+        travel, np.zeros((2, 3, 24), dtype=int), possibilities, max_bikes_per_hub=10,
+        initial_bikes_per_hub=25)
+    assert no_bike.sum() == 0
+    assert no_parking.sum() == 0
+
+
+def test_destination_table_shares_rows_within_a_block():
+    import simulation_main as sim
+    table = batch.DestinationTable(sim.build_probabilities(10), 10)
+    dests, probs = table.row(2, 8)
+    again, _ = table.row(2, 11)  # 8am-12pm is one block
+    assert again is dests
+    assert dests.dtype == np.int32
+    assert abs(probs.sum() - 1) < 1e-12
+    assert len(table._cache) == 1
+
+    draws = table.sample(2, 9, 50, np.random.default_rng(4))
+    expected = np.random.default_rng(4).choice(dests, 50, p=probs)
+    np.testing.assert_array_equal(draws, expected)
+
+
+class _FreshRows:
+    # builds a new one-hot row on every access, so no row outlives the lookup
+    def __init__(self, num_hubs):
+        self.num_hubs = num_hubs
+
+    def __getitem__(self, hub):
+        return _FreshHours(hub, self.num_hubs)
+
+
+class _FreshHours:
+    def __init__(self, hub, num_hubs):
+        self.hub, self.num_hubs = hub, num_hubs
+
+    def __getitem__(self, hour):
+        return np.eye(self.num_hubs)[(self.hub + 1) % self.num_hubs].copy()
+
+
+def test_destination_table_rows_built_on_access_stay_per_hub():
+    table = batch.DestinationTable(_FreshRows(5), 5)
+    firsts = [int(table.row(hub, 3)[0][0]) for hub in range(5)]
+    assert firsts == [1, 2, 3, 4, 0]
+    assert [int(table.sample(hub, 3, 1, np.random.default_rng(0))[0]) for hub in range(5)] == [1, 2, 3, 4, 0]
@@ -0,0 +1,37 @@
+from day_archive import DayArchive
+
+
+def _write_log(path, rows):
+    with open(path, "w") as f:
+        f.write("hub,start_time\n")
+        for hub, start in rows:
+            f.write(f"{hub},{start}\n")
+
+
+def test_empty_log_gives_empty_archive(tmp_path):
+    log = tmp_path / "rentals.csv"
+    _write_log(log, [])
+    for keep_times in (True, False):
+        archive = DayArchive.from_log(str(log), num_hubs=3, keep_times=keep_times)
+        assert archive.counts.shape == (0, 3, 24)
+        assert archive.num_days == 0
+        assert len(archive.pool()) == 0
+    assert len(archive.dates) == 0
+    archive = DayArchive.from_log(str(log), num_hubs=3)
+    assert len(archive.times) == 0
+    assert archive.offsets.tolist() == [0]
+
+    archive.save(str(tmp_path / "archive"))
+    reopened = DayArchive.open(str(tmp_path / "archive"))
+    assert reopened.counts.shape == (0, 3, 24)
+    assert len(reopened.times) == 0
+
+
+def test_log_round_trips_times(tmp_path):
+    log = tmp_path / "rentals.csv"
+    _write_log(log, [(1, "2024-03-04T08:15"), (0, "2024-03-04T09:30"), (1, "2024-03-05T07:45")])
+    archive = DayArchive.from_log(str(log), num_hubs=2)
+    assert archive.num_days == 2
+    assert archive.counts[0, 1, 8] == 1
+    assert archive.day_times(0)[1].tolist() == [8.25]
+    assert archive.day_times(1)[1].tolist() == [7.75]
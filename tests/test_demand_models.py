@@ -0,0 +1,16 @@
+import numpy as np
+import pytest
+from demand_models import DemandModel, PoissonDemand
+
+
+def test_incomplete_model_fails_when_instantiated():
+    class NoCounts(DemandModel):
+        pass
+
+    with pytest.raises(TypeError):
+        NoCounts()
+
+
+def test_poisson_counts_shape():
+    counts = PoissonDemand().sample_counts(np.ones((3, 24)), 4, np.random.default_rng(0))
+    assert counts.shape == (4, 3, 24)
@@ -0,0 +1,44 @@
+import numpy as np
+import birth_death
+import fluid_model
+import simulation_main as sim
+from constants import travel_time
+from converted_population import converted_population
+from flow_report import expected_flows
+from hourly_lambdas import lambda_matrix
+
+
+def _layouts(num_hubs):
+    probabilities = sim.build_probabilities(num_hubs)
+    by_hub = np.array([[probabilities[hub][hour] for hour in range(24)] for hub in range(num_hubs)])
+    return probabilities, by_hub, fluid_model.destination_tensor(probabilities, num_hubs)
+
+
+def test_fluid_simulation_accepts_every_probability_layout():
+    lambdas = lambda_matrix(converted_population, "W", 10)
+    results = [fluid_model.fluid_simulation(travel_time, lambdas, layout, [5, 10], [10, 20])
+               for layout in _layouts(10)]
+    for no_bike, no_parking in results[1:]:
+        np.testing.assert_allclose(no_bike, results[0][0])
+        np.testing.assert_allclose(no_parking, results[0][1])
+
+
+def test_expected_flows_accepts_every_probability_layout():
+    reports = [expected_flows(travel_time, converted_population, layout) for layout in _layouts(10)]
+    for report in reports[1:]:
+        np.testing.assert_allclose(report.net, reports[0].net)
+
+
+def test_hub_rates_accepts_every_probability_layout():
+    lambdas = lambda_matrix(converted_population, "W", 10)
+    rates = [birth_death.hub_rates(travel_time, lambdas, layout) for layout in _layouts(10)]
+    for rentals, returns in rates[1:]:
+        np.testing.assert_allclose(rentals, rates[0][0])
+        np.testing.assert_allclose(returns, rates[0][1])
+
+
+def test_24_hubs_reads_the_simulation_layout():
+    rng = np.random.default_rng(0)
+    by_hub = rng.random((24, 24, 24))
+    tensor = fluid_model.as_destination_tensor(by_hub, 24)
+    np.testing.assert_allclose(tensor[5, 3], by_hub[3, 5] / by_hub[3, 5].sum())
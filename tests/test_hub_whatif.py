@@ -0,0 +1,17 @@
+from hub_whatif import Candidate, HubWhatIf
+from network_generator import middlebury_network
+
+
+def _candidate(net, name, like):
+    return Candidate(name, net.travel_time[like], net.travel_time[:, like], net.elevation_matrix[like],
+                     net.elevation_matrix[:, like], net.sizes[like])
+
+
+def test_candidate_results_do_not_depend_on_call_order():
+    net = middlebury_network()
+    library, depot = _candidate(net, "library", 8), _candidate(net, "depot", 3)
+    whatif = HubWhatIf(net, replications=50, seed=2)
+    first = whatif.add(library).delta_no_bike
+    whatif.add(depot)
+    assert whatif.add(library).delta_no_bike == first
+    assert HubWhatIf(net, replications=50, seed=2).add(library).delta_no_bike == first
@@ -0,0 +1,17 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _loaded_after_import(module: str, heavy: str) -> bool:
+    code = f"import sys, {module}; print({heavy!r} in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return result.stdout.strip() == "True"
+
+
+def test_entry_points_do_not_load_data_modules():
+    for module in ("simulation_main", "middbike"):
+        for heavy in ("testdata", "converted_population", "matplotlib", "networkx"):
+            assert not _loaded_after_import(module, heavy), f"{module} loads {heavy}"
@@ -0,0 +1,17 @@
+import pytest
+import middbike
+from scenario_store import MAGIC, _TAIL
+
+
+def test_missing_store_raises_without_writing(tmp_path):
+    output = tmp_path / "out.csv"
+    with pytest.raises(ValueError, match="does not exist"):
+        middbike.main(["sweep", "--store", str(tmp_path / "missing.bin"), "--output", str(output)])
+    assert not output.exists()
+
+
+def test_empty_store_raises(tmp_path):
+    store = tmp_path / "empty.bin"
+    store.write_bytes(MAGIC + b"{}" + _TAIL.pack(len(MAGIC)) + MAGIC)
+    with pytest.raises(ValueError, match="has no scenarios"):
+        middbike.main(["simulate", "--store", str(store)])
@@ -0,0 +1,42 @@
+import networkx as nx
+import numpy as np
+from rebalancing import RebalancingPlanner
+from simulation_code import build_complete_digraph, travel_matrix
+
+
+def test_missing_roads_are_not_free_moves():
+    # 0 -> 1 -> 2 is the only way from hub 0 to hub 2
+    G = nx.DiGraph()
+    G.add_nodes_from(range(3))
+    G.add_edge(0, 1, time=5)
+    G.add_edge(1, 2, time=7)
+    G.add_edge(2, 0, time=4)
+    times = travel_matrix(G)
+    assert np.isinf(times[0, 2])
+    planner = RebalancingPlanner(G)
+    assert planner.times[0, 2] == 12
+    assert planner.plan(np.array([3, 0, -3])) == [(0, 2, 3.0, 12.0)]
+    # nothing reaches hub 0 from hub 1 except through hub 2
+    assert planner.times[1, 0] == 11
+
+
+def test_complete_digraph_round_trips_as_int():
+    travel = np.array([[0, 4, 9], [3, 0, 2], [8, 6, 0]])
+    times = travel_matrix(build_complete_digraph(travel))
+    assert times.dtype.kind == "i"
+    np.testing.assert_array_equal(times, travel)
+
+
+def test_simulation_rejects_missing_roads():
+    import pytest
+    from simulation_code import simulation
+    G = nx.DiGraph()
+    G.add_nodes_from(range(3))
+    G.add_edge(0, 1, time=5)
+    G.add_edge(1, 2, time=7)
+    G.add_edge(2, 0, time=4)
+    demand = {hub: np.ones(24, dtype=int) for hub in range(3)}
+    probabilities = {hub: {hour: np.eye(3)[(hub + 1) % 3] for hour in range(24)} for hub in range(3)}
+    for keep_log in (True, False):
+        with pytest.raises(ValueError):
+            simulation(G, demand, probabilities, keep_log=keep_log)
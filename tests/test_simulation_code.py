@@ -0,0 +1,67 @@
+import numpy as np
+import simulation_code as code
+
+# hub 0 riders go to hub 1, everyone else rides to hub 0; no destination draw is random
+TRAVEL = np.array([[0, 30, 50], [30, 0, 20], [50, 20, 0]])
+POSSIBILITIES = {hub: {hour: np.eye(3)[1 if hub == 0 else 0] for hour in range(24)} for hub in range(3)}
+
+
+def _run(demand, stock, keep_log):
+    return code.simulation(TRAVEL, {hub: demand[hub] for hub in range(3)}, POSSIBILITIES,
+                           max_bikes_per_hub=3, initial_bikes_per_hub=stock, keep_log=keep_log,
+                           rng=np.random.default_rng(0))
+
+
+def test_overflow_goes_to_the_nearest_hub_with_a_free_dock():
+    demand = np.zeros((3, 24), dtype=int)
+    demand[0, 5] = 2
+    no_bike, no_parking, log = _run(demand, 2, keep_log=True)
+    # both land at hub 1 in hour 6; one dock is free, so the second trip overflows and
+    # rides 20 minutes to hub 2, the nearest hub with space, docking in hour 7
+    assert no_bike.sum() == 0
+    assert no_parking.tolist() == [0] * 6 + [1] + [0] * 17
+    assert [(req.origin, req.dest, req.success) for req in log] == [(0, 1, True), (0, 2, True)]
+
+
+def test_full_hubs_send_every_overflow_on_and_count_each_hour():
+    demand = np.zeros((3, 24), dtype=int)
+    demand[0, 5] = 2
+    demand[1, 10] = 5
+    no_bike, no_parking, log = _run(demand, 3, keep_log=True)
+    expected_parking = np.zeros(24, dtype=int)
+    # hour 6: hub 1 is full, both riders move on to hub 0 (hub 2 is full too)
+    expected_parking[6] = 2
+    # hour 11: the three rentals from hub 1 find hub 0 full and ride back to hub 1
+    expected_parking[11] = 3
+    assert no_parking.tolist() == expected_parking.tolist()
+    assert no_bike.tolist() == [0] * 10 + [2] + [0] * 13
+    assert [req.dest for req in log if req.origin == 0] == [0, 0]
+    assert [req.dest for req in log if req.origin == 1 and req.success] == [1, 1, 1]
+    assert sum(not req.success for req in log) == 2
+
+
+def test_trip_log_does_not_change_the_counters():
+    rng = np.random.default_rng(5)
+    demand = rng.poisson(2.0, size=(3, 24))
+    for stock in (0, 2, 3, 5):
+        with_log = _run(demand, stock, keep_log=True)
+        without_log = _run(demand, stock, keep_log=False)
+        np.testing.assert_array_equal(with_log[0], without_log[0])
+        np.testing.assert_array_equal(with_log[1], without_log[1])
+        assert without_log[2] == []
+        assert len(with_log[2]) == demand.sum()
+
+
+def test_seeded_counters_do_not_depend_on_the_probability_layout():
+    import batch_simulation as batch
+    import simulation_main as sim
+    from constants import travel_time
+    probabilities = sim.build_probabilities(10)
+    by_hub = np.array([[probabilities[hub][hour] for hour in range(24)] for hub in range(10)])
+    shared = batch.DestinationTable(probabilities, 10)
+    demand = dict(enumerate(np.random.default_rng(1).poisson(3.0, size=(10, 24))))
+    runs = [code.simulation(travel_time, demand, layout, keep_log=False, rng=np.random.default_rng(9))
+            for layout in (probabilities, by_hub, shared, shared)]
+    for no_bike, no_parking, _ in runs[1:]:
+        np.testing.assert_array_equal(no_bike, runs[0][0])
+        np.testing.assert_array_equal(no_parking, runs[0][1])
@@ -0,0 +1,11 @@
+import simulation_main as sim
+
+
+def test_vectorized_chunks_draw_distinct_replications():
+    first = sim.run_simulation(10, 5, replications=20, seed=7, vectorized=True)
+    again = sim.run_simulation(10, 5, replications=20, seed=7, vectorized=True)
+    second = sim.run_simulation(10, 5, replications=20, seed=7, first_replication=20, vectorized=True)
+    second_again = sim.run_simulation(10, 5, replications=20, seed=7, first_replication=20, vectorized=True)
+    assert first == again
+    assert second == second_again
+    assert first != second
@@ -0,0 +1,24 @@
+import numpy as np
+import trace_replay
+
+
+def _write_log(path, rows):
+    with open(path, "w") as f:
+        f.write("origin,destination,start_time\n")
+        for origin, dest, start in rows:
+            f.write(f"{origin},{dest},{start}\n")
+
+
+def test_carry_over_with_stock_above_capacity_finishes(tmp_path):
+    travel = np.array([[0, 10, 20], [10, 0, 10], [20, 10, 0]])
+    log = tmp_path / "trips.csv"
+    _write_log(log, [(0, 1, "2024-03-04T08:00"), (1, 2, "2024-03-04T08:30"), (2, 0, "2024-03-04T23:55"),
+                     (0, 2, "2024-03-05T09:00"), (1, 0, "2024-03-05T23:58")])
+    for reset_daily in (True, False):
+        replayer, = trace_replay.replay(str(log), travel, [(15, 10)], reset_daily=reset_daily)
+        summary = replayer.summary()
+        assert summary["stock"] == 15
+        assert summary["rentals"] == 5
+        assert summary["no_bike"] == 0
+        # stock above capacity is replayed as given; those hubs take no returns until they drain
+        assert replayer.stock[1] > 10
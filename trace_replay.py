@@ -0,0 +1,216 @@
+from __future__ import annotations
+import argparse
+import csv
+import heapq
+import sys
+from itertools import islice
+from typing import Dict, Iterator, List, Sequence, Tuple
+import numpy as np
+
+"""
+Replays a recorded trip log against a candidate stock/capacity configuration, to see the
+stockouts it would have caused on historical traffic. Rentals are taken from the log in
+time order, each with its recorded destination (and return time, when the log has one);
+returns are kept in a heap and docked as their time comes, with the rules of
+simulation_code.simulation:
+    - a rental at a hub with no bike is a no-bike event and the trip never happens
+    - a return to a full hub is a no-parking event; the rider goes on to the nearest hub
+      with a free dock, or waits an hour at the full hub if every hub is full; a hub
+      stocked above capacity takes no returns until rentals bring it below
+    - with reset_daily, every hub starts each day with the initial stock and bikes still
+      out at midnight are dropped, as in one simulated day per date
+The log is read chunk_rows rows at a time and shared by every configuration, so memory
+is bounded by the chunk and the bikes in transit, and a season replays in seconds.
+
+    python trace_replay.py rides.csv --stock 5 10 --capacity 10 20
+"""
+
+FIELDS = ("stock", "capacity", "days", "rentals", "no_bike", "no_parking", "redirects")
+
+
+def read_trips(
+    path: str,
+    *,
+    origin_column: str = "origin",
+    destination_column: str = "destination",
+    time_column: str = "start_time",
+    end_column: str | None = None,
+    hub_index: Dict[str, int] | None = None,
+    chunk_rows: int = 100_000,
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray | None]]:
+    """
+    (origins, destinations, start minutes, end minutes or None) for every chunk_rows rows of
+    a trip log CSV sorted by start time. Minutes count from 1970-01-01; hubs are integer
+    indices, or names looked up in hub_index.
+    """
+    def hubs(values: List[str]) -> np.ndarray:
+        if hub_index is not None:
+            return np.array([hub_index[value] for value in values], dtype=np.intp)
+        return np.array(values, dtype=np.intp)
+
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        while True:
+            rows = list(islice(reader, chunk_rows))
+            if not rows:
+                return
+            starts = np.array([row[time_column] for row in rows], dtype="datetime64[m]").astype(np.int64)
+            ends = None
+            if end_column is not None:
+                ends = np.array([row[end_column] for row in rows], dtype="datetime64[m]").astype(np.int64)
+            yield (hubs([row[origin_column] for row in rows]), hubs([row[destination_column] for row in rows]),
+                   starts, ends)
+
+
+class TraceReplayer:
+    """ Event-driven replay of one stock/capacity configuration
+
+    Attributes
+    ----------
+    no_bike, no_parking, redirects: (24,) int64 - events per hour of the day
+    rentals: int - trips in the log
+    days: int - dates replayed
+    """
+    def __init__(self,
+                 travel: np.ndarray,
+                 *,
+                 max_bikes_per_hub: int = 10,
+                 initial_bikes_per_hub: int = 5,
+                 reset_daily: bool = True,
+                ) -> None:
+        self.travel = np.asarray(travel)
+        self.num_hubs = self.travel.shape[0]
+        self.capacity = max_bikes_per_hub
+        self.initial = initial_bikes_per_hub
+        self.reset_daily = reset_daily
+        # other hubs by travel time from each hub, nearest first
+        self._nearest = [[int(h) for h in order if h != hub]
+                         for hub, order in enumerate(np.argsort(self.travel, axis=1, kind="stable"))]
+        self._travel = self.travel.tolist()
+        self.stock = [initial_bikes_per_hub] * self.num_hubs
+        self._returns: List[Tuple[int, int]] = []  # heap of (minute, hub)
+        self._day: int | None = None
+        self._last = None
+        self.no_bike = np.zeros(24, dtype=np.int64)
+        self.no_parking = np.zeros(24, dtype=np.int64)
+        self.redirects = np.zeros(24, dtype=np.int64)
+        self.rentals = 0
+        self.days = 0
+
+    def _dock_until(self, minute: int) -> None:
+        # dock every return due at or before minute
+        returns, stock, capacity = self._returns, self.stock, self.capacity
+        while returns and returns[0][0] <= minute:
+            when, hub = heapq.heappop(returns)
+            if stock[hub] < capacity:
+                stock[hub] += 1
+                continue
+            hour = when % 1440 // 60
+            self.no_parking[hour] += 1
+            for target in self._nearest[hub]:
+                if stock[target] < capacity:
+                    self.redirects[hour] += 1
+                    heapq.heappush(returns, (when + max(int(self._travel[hub][target]), 1), target))
+                    break
+            else:
+                heapq.heappush(returns, (when + 60, hub))
+
+    def _start_day(self, day: int) -> None:
+        if self._day is not None:
+            self._dock_until(day * 1440 - 1)
+        if self._day is None or self.reset_daily:
+            self.stock = [self.initial] * self.num_hubs
+            self._returns = []
+        self._day = day
+        self.days += 1
+
+    def feed(self, origins: np.ndarray, destinations: np.ndarray, starts: np.ndarray,
+             ends: np.ndarray | None = None) -> None:
+        """
+        Replay one chunk of trips; chunks must come in start-time order.
+        """
+        if len(starts) and (np.any(np.diff(starts) < 0) or (self._last is not None and starts[0] < self._last)):
+            raise ValueError("trips must be sorted by start time")
+        if ends is None:
+            ends = starts + self.travel[origins, destinations]
+        stock, returns = self.stock, self._returns
+        for origin, dest, start, end in zip(origins.tolist(), destinations.tolist(), starts.tolist(), ends.tolist()):
+            day = start // 1440
+            if day != self._day:
+                self._start_day(day)
+                stock, returns = self.stock, self._returns
+            self._dock_until(start)
+            self.rentals += 1
+            if stock[origin] == 0:
+                self.no_bike[start % 1440 // 60] += 1
+                continue
+            stock[origin] -= 1
+            heapq.heappush(returns, (max(end, start), dest))
+        if len(starts):
+            self._last = starts[-1]
+
+    def finish(self) -> Dict[str, object]:
+        """
+        Dock what is left of the last day and summarize. Bikes still out at the end of the
+        last day are dropped, with or without reset_daily.
+        """
+        if self._day is not None:
+            self._dock_until((self._day + 1) * 1440 - 1)
+        return self.summary()
+
+    def summary(self) -> Dict[str, object]:
+        """
+        One FIELDS row of totals.
+        """
+        return {"stock": self.initial, "capacity": self.capacity, "days": self.days, "rentals": self.rentals,
+                "no_bike": int(self.no_bike.sum()), "no_parking": int(self.no_parking.sum()),
+                "redirects": int(self.redirects.sum())}
+
+
+def replay(
+    path: str,
+    travel: np.ndarray,
+    configurations: Sequence[Tuple[int, int]],
+    *,
+    reset_daily: bool = True,
+    **read_args,
+    ) -> List[TraceReplayer]:
+    """
+    Replay a trip log once for every (initial stock, capacity) in configurations, reading it
+    a single time. read_args go to read_trips.
+    returns:
+        the finished replayers, in configurations order
+    """
+    replayers = [TraceReplayer(travel, max_bikes_per_hub=capacity, initial_bikes_per_hub=stock,
+                               reset_daily=reset_daily) for stock, capacity in configurations]
+    for chunk in read_trips(path, **read_args):
+        for replayer in replayers:
+            replayer.feed(*chunk)
+    for replayer in replayers:
+        replayer.finish()
+    return replayers
+
+
+if __name__ == "__main__":
+    from constants import location_index, travel_time
+
+    parser = argparse.ArgumentParser(description="Replay a recorded trip log against stock/capacity configurations.")
+    parser.add_argument("log", help="CSV with origin, destination and start_time columns, sorted by start time")
+    parser.add_argument("--stock", type=int, nargs="+", default=[5])
+    parser.add_argument("--capacity", type=int, nargs="+", default=[10])
+    parser.add_argument("--end-column", help="recorded return time column; travel_time is used when omitted")
+    parser.add_argument("--hub-names", action="store_true",
+                        help="hub columns hold constants.location_index names, not indices")
+    parser.add_argument("--carry-over", action="store_true",
+                        help="keep stock and bikes in transit across midnight instead of resetting each day")
+    parser.add_argument("--chunk-rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    configurations = [(stock, capacity) for stock in args.stock for capacity in args.capacity]
+    replayers = replay(args.log, travel_time, configurations, reset_daily=not args.carry_over,
+                       end_column=args.end_column, hub_index=location_index if args.hub_names else None,
+                       chunk_rows=args.chunk_rows)
+    writer = csv.DictWriter(sys.stdout, fieldnames=FIELDS)
+    writer.writeheader()
+    for replayer in replayers:
+        writer.writerow(replayer.summary())